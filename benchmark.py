@@ -0,0 +1,222 @@
+"""Offline throughput/latency benchmark for the MCP server
+
+Starts stubserver.py as a local Prokerala stand-in, starts coremcp.py
+against it, then drives the real tools over SSE from many concurrent
+synthetic sessions and reports latency percentiles and calls/sec.
+
+    python benchmark.py --sessions 50 --calls 40 --latency-ms 80 --unique 0.3
+
+No API credits or LLM are used. Pass --json to get a machine-readable
+report for comparing runs.
+
+With --upstream-mode record the server saves every upstream response to
+--fixtures; a later run with --upstream-mode replay and the same --seed
+serves them back without starting the stub or touching the network.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from mcp import ClientSession
+from mcp.client.sse import sse_client
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SIGNS = ["aries", "taurus", "gemini", "cancer", "leo", "virgo",
+         "libra", "scorpio", "sagittarius", "capricorn", "aquarius", "pisces"]
+
+# Popular places and birth times that repeat across sessions (cache-friendly traffic)
+HOT_COORDINATES = ["8.8932,76.6141", "9.9312,76.2673", "12.9716,77.5946", "19.076,72.8777", "28.6139,77.209"]
+HOT_DATETIMES = ["1983-03-21T23:30:00+05:30", "1990-07-04T06:15:00+05:30", "1995-12-25T12:00:00+05:30"]
+
+
+def random_coordinates(rng):
+    return f"{rng.uniform(8, 30):.4f},{rng.uniform(70, 90):.4f}"
+
+
+def random_datetime(rng):
+    return (f"{rng.randint(1960, 2010)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+            f"T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00+05:30")
+
+
+def synthetic_call(rng, unique):
+    """Pick a tool and arguments; `unique` is the share of calls with never-seen params"""
+    fresh = rng.random() < unique
+    coordinates = random_coordinates(rng) if fresh else rng.choice(HOT_COORDINATES)
+    dt = random_datetime(rng) if fresh else rng.choice(HOT_DATETIMES)
+    tool = rng.choice(["get_panchang", "get_kundli", "get_birth_details", "get_planet_positions",
+                       "get_daily_horoscope", "get_kundli_matching", "get_mangal_dosha"])
+    if tool in ("get_panchang", "get_kundli"):
+        return tool, {"coordinates": coordinates, "datetime_str": dt}
+    if tool == "get_daily_horoscope":
+        return tool, {"sign": rng.choice(SIGNS), "datetime_str": dt}
+    if tool == "get_kundli_matching":
+        other = random_coordinates(rng) if fresh else rng.choice(HOT_COORDINATES)
+        return tool, {"girl_coordinates": coordinates, "girl_dob": dt,
+                      "boy_coordinates": other, "boy_dob": rng.choice(HOT_DATETIMES)}
+    return tool, {"coordinates": coordinates, "datetime": dt}
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies):
+    values = sorted(latencies)
+    return {
+        "calls": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p90_ms": round(percentile(values, 90) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+        "max_ms": round(values[-1] * 1000, 2) if values else 0.0,
+    }
+
+
+async def run_session(url, calls, unique, seed, results):
+    rng = random.Random(seed)
+    async with sse_client(url) as (read, write):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            for _ in range(calls):
+                tool, arguments = synthetic_call(rng, unique)
+                started = time.perf_counter()
+                error = False
+                try:
+                    result = await session.call_tool(tool, arguments)
+                    text = result.content[0].text if result.content else ""
+                    error = result.isError or text.startswith(("Error:", "API Error:"))
+                except Exception:
+                    error = True
+                results.append((tool, time.perf_counter() - started, error))
+
+
+async def drive(url, sessions, calls, unique, seed):
+    results = []
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(
+        *(run_session(url, calls, unique, seed + i, results) for i in range(sessions)),
+        return_exceptions=True,
+    )
+    elapsed = time.perf_counter() - started
+    session_errors = [repr(o) for o in outcomes if isinstance(o, BaseException)]
+    return results, elapsed, session_errors
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with socket.socket() as sock:
+            if sock.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.1)
+    raise RuntimeError(f"Nothing listening on port {port} after {timeout}s")
+
+
+def scrape_gauge(metrics_text, name):
+    for line in metrics_text.splitlines():
+        if line.startswith(name + " "):
+            return float(line.split()[1])
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20, help="Concurrent MCP sessions")
+    parser.add_argument("--calls", type=int, default=25, help="Tool calls per session")
+    parser.add_argument("--unique", type=float, default=0.3, help="Share of calls with unique params (cache misses)")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Stub upstream latency")
+    parser.add_argument("--jitter-ms", type=float, default=20.0, help="Stub upstream latency jitter")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Stub upstream 503 rate")
+    parser.add_argument("--server-port", type=int, default=8100)
+    parser.add_argument("--stub-port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--upstream-mode", choices=["live", "record", "replay"], default="live",
+                        help="Server upstream mode (replay needs no stub)")
+    parser.add_argument("--fixtures", default="fixtures.sqlite", help="Fixture store for record/replay")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="prokerala-bench-")
+    stub = None
+    if args.upstream_mode != "replay":
+        stub = subprocess.Popen(
+            [sys.executable, os.path.join(HERE, "stubserver.py"), "--port", str(args.stub_port),
+             "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+             "--error-rate", str(args.error_rate)],
+            cwd=workdir,
+        )
+    server_env = {
+        **os.environ,
+        "PROKERALA_API_BASE": f"http://127.0.0.1:{args.stub_port}",
+        "PROKERALA_UPSTREAM_MODE": args.upstream_mode,
+        "PROKERALA_FIXTURE_PATH": os.path.abspath(args.fixtures),
+        "TOKEN_FILE_PATH": os.path.join(workdir, "access_token.json"),
+        "FASTMCP_PORT": str(args.server_port),
+        "FASTMCP_LOG_LEVEL": "WARNING",
+    }
+    server_env.setdefault("PROKERALA_RATE_LIMIT_PER_SECOND", "0")
+    server_log = open(os.path.join(workdir, "server.log"), "w")
+    server = subprocess.Popen([sys.executable, os.path.join(HERE, "coremcp.py")], cwd=workdir,
+                              env=server_env, stdout=server_log, stderr=subprocess.STDOUT)
+    try:
+        if stub is not None:
+            wait_for_port(args.stub_port)
+        wait_for_port(args.server_port)
+        url = f"http://127.0.0.1:{args.server_port}/sse"
+        results, elapsed, session_errors = asyncio.run(
+            drive(url, args.sessions, args.calls, args.unique, args.seed)
+        )
+        metrics_text = httpx.get(f"http://127.0.0.1:{args.server_port}/metrics").text
+    finally:
+        server.terminate()
+        server.wait(10)
+        if stub is not None:
+            stub.terminate()
+            stub.wait(10)
+        server_log.close()
+
+    per_tool = {}
+    for tool, latency, _ in results:
+        per_tool.setdefault(tool, []).append(latency)
+    report = {
+        "config": vars(args),
+        "elapsed_s": round(elapsed, 3),
+        "calls_per_s": round(len(results) / elapsed, 2) if elapsed else 0.0,
+        "errors": sum(1 for _, _, error in results if error),
+        "session_errors": session_errors,
+        "overall": summarize([latency for _, latency, _ in results]),
+        "tools": {tool: summarize(values) for tool, values in sorted(per_tool.items())},
+        "cache_hit_ratio": scrape_gauge(metrics_text, "prokerala_cache_hit_ratio"),
+        "server_log": server_log.name,
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    overall = report["overall"]
+    print(f"{overall['calls']} calls in {report['elapsed_s']}s -> {report['calls_per_s']} calls/s, "
+          f"{report['errors']} errors, cache hit ratio {report['cache_hit_ratio']}")
+    print(f"{'tool':<24}{'calls':>7}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for tool, stats in [("overall", overall)] + list(report["tools"].items()):
+        print(f"{tool:<24}{stats['calls']:>7}{stats['p50_ms']:>10}{stats['p90_ms']:>10}"
+              f"{stats['p99_ms']:>10}{stats['max_ms']:>10}")
+    for error in session_errors:
+        print(f"session failed: {error}")
+
+
+if __name__ == "__main__":
+    main()
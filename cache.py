@@ -0,0 +1,317 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+logger = logging.getLogger("pyyan")
+
+# TTL policies: None caches forever, DAY caches until the next local midnight
+DAY = "day"
+
+
+def make_cache_key(endpoint, params):
+    """Build a stable cache key from an endpoint and its query params"""
+    canonical = {str(k): str(v) for k, v in params.items()}
+    return f"{endpoint}?{json.dumps(canonical, sort_keys=True, separators=(',', ':'))}"
+
+
+def expiry_for(ttl, now=None, day=None):
+    """Turn a TTL policy into an absolute expiry timestamp (None means never)
+
+    For DAY, an aware datetime of the request keeps the entry until the end
+    of that date in its own UTC offset if that is later than local midnight,
+    so a day prefetched for another timezone lasts through that day.
+    """
+    now = time.time() if now is None else now
+    if ttl is None:
+        return None
+    if ttl == DAY:
+        midnight = datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0)
+        expires_at = (midnight + timedelta(days=1)).timestamp()
+        if day is not None:
+            day_end = day.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+            expires_at = max(expires_at, day_end.timestamp())
+        return expires_at
+    return now + ttl
+
+
+class CachedResponse:
+    """Body of a successful upstream response"""
+
+    __slots__ = ("content", "content_type", "expires_at")
+
+    def __init__(self, content, content_type, expires_at):
+        self.content = content
+        self.content_type = content_type
+        self.expires_at = expires_at
+
+    def is_expired(self, now=None):
+        now = time.time() if now is None else now
+        return self.expires_at is not None and now >= self.expires_at
+
+    def is_usable(self, max_stale=0, now=None):
+        """Fresh, or expired for no longer than max_stale seconds"""
+        now = time.time() if now is None else now
+        return not self.is_expired(now - max_stale)
+
+
+class ResponseCache:
+    """In-memory LRU cache of upstream responses with per-entry expiry
+
+    An optional disk tier (SqliteCache) sits behind the memory layer; use
+    lookup()/store() to go through both tiers. Lookups with max_stale > 0
+    may return an expired entry (check entry.is_expired()) so the caller
+    can serve it while revalidating. Expired entries are kept in memory for
+    stale_retention seconds so peek() can still fall back to them.
+    """
+
+    def __init__(self, max_entries=2048, max_bytes=64 * 1024 * 1024, disk=None, compact_interval=300,
+                 stale_retention=0):
+        self.max_entries = max_entries
+        self.stale_retention = stale_retention
+        self.max_bytes = max_bytes
+        self.disk = disk
+        self.compact_interval = compact_interval
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._last_compaction = time.time()
+        self._compaction_task = None
+        self.hits = 0
+        self.stale_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.endpoint_stats = {}
+
+    async def lookup(self, key, endpoint=None, max_stale=0):
+        """Look a key up in memory, then on disk, promoting disk hits to memory"""
+        entry = self.get(key, endpoint, max_stale)
+        if entry is not None or self.disk is None:
+            return entry
+
+        try:
+            entry = await asyncio.to_thread(self.disk.get, key, max_stale)
+        except sqlite3.Error as e:
+            logger.error(f"Disk cache read failed: {str(e)}")
+            return None
+        if entry is not None:
+            # The memory lookup already counted a miss; reclassify it
+            self._uncount(endpoint, "misses")
+            self._count(endpoint, "disk_hits")
+            if entry.is_expired():
+                self.stale_hits += 1
+            self._put(key, entry)
+        return entry
+
+    async def peek(self, key, max_stale=0):
+        """Return an entry fresh or within max_stale seconds of expiry from either tier, without counting a hit or miss"""
+        entry = self._entries.get(key)
+        if entry is not None and entry.is_usable(max_stale):
+            return entry
+        if self.disk is None:
+            return None
+        try:
+            entry = await asyncio.to_thread(self.disk.get, key, max_stale)
+        except sqlite3.Error as e:
+            logger.error(f"Disk cache read failed: {str(e)}")
+            return None
+        if entry is not None:
+            self._put(key, entry)
+        return entry
+
+    async def store(self, key, content, content_type, ttl, day=None):
+        """Store a response body in memory and on disk; day is passed to expiry_for"""
+        entry = CachedResponse(content, content_type, expiry_for(ttl, day=day))
+        self._put(key, entry)
+        if self.disk is None:
+            return
+        try:
+            await asyncio.to_thread(self.disk.set, key, entry)
+        except sqlite3.Error as e:
+            logger.error(f"Disk cache write failed: {str(e)}")
+        self._maybe_compact()
+
+    def warm_from_disk(self, limit):
+        """Load the most recently used disk entries into memory"""
+        if self.disk is None or limit <= 0:
+            return 0
+        loaded = 0
+        # recent() is most recent first; insert oldest first so the LRU order matches
+        for key, entry in reversed(self.disk.recent(limit)):
+            self._put(key, entry)
+            loaded += 1
+        logger.info(f"Warmed response cache with {loaded} entries from disk")
+        return loaded
+
+    def _maybe_compact(self):
+        if time.time() - self._last_compaction < self.compact_interval:
+            return
+        if self._compaction_task is not None and not self._compaction_task.done():
+            return
+        self._last_compaction = time.time()
+        self._compaction_task = asyncio.create_task(asyncio.to_thread(self.disk.compact))
+
+    def get(self, key, endpoint=None, max_stale=0):
+        """Return a cached response that is fresh or within max_stale seconds of expiry, or None"""
+        entry = self._entries.get(key)
+        if entry is not None and not entry.is_usable(max_stale):
+            if not entry.is_usable(self.stale_retention):
+                self._remove(key)
+            entry = None
+
+        if entry is None:
+            self._count(endpoint, "misses")
+            return None
+
+        self._entries.move_to_end(key)
+        self._count(endpoint, "hits")
+        if entry.is_expired():
+            self.stale_hits += 1
+        return entry
+
+    def _put(self, key, entry):
+        if len(entry.content) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        self._bytes += len(entry.content)
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        lookups = self.hits + self.disk_hits + self.misses
+        hit_count = self.hits + self.disk_hits
+        stats = {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(hit_count / lookups, 4) if lookups else 0.0,
+            "endpoints": {name: dict(counts) for name, counts in self.endpoint_stats.items()},
+        }
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats()
+        return stats
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= len(entry.content)
+
+    def _count(self, endpoint, field, delta=1):
+        setattr(self, field, getattr(self, field) + delta)
+        if endpoint is not None:
+            counts = self.endpoint_stats.setdefault(endpoint, {"hits": 0, "disk_hits": 0, "misses": 0})
+            counts[field] += delta
+
+    def _uncount(self, endpoint, field):
+        self._count(endpoint, field, -1)
+
+
+class SqliteCache:
+    """Persistent cache tier shared by worker processes and across restarts
+
+    Bodies are zlib-compressed. The database runs in WAL mode so readers in
+    other processes don't block on writers. compact() drops expired rows
+    and trims least recently used rows down to max_bytes; expired rows are
+    kept for stale_retention seconds so they can still be served stale.
+    """
+
+    def __init__(self, path, max_bytes=512 * 1024 * 1024, stale_retention=0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.stale_retention = stale_retention
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, content BLOB NOT NULL, content_type TEXT NOT NULL, "
+                "expires_at REAL, size INTEGER NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+
+    def get(self, key, max_stale=0):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, content_type, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[2] is not None and now >= row[2] + max_stale:
+                if now >= row[2] + self.stale_retention:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        return CachedResponse(zlib.decompress(row[0]), row[1], row[2])
+
+    def set(self, key, entry):
+        compressed = zlib.compress(entry.content, 6)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, content, content_type, expires_at, size, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, compressed, entry.content_type, entry.expires_at, len(compressed), time.time()),
+            )
+
+    def recent(self, limit):
+        """Most recently used, unexpired entries (for warm start)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, content, content_type, expires_at FROM responses "
+                "WHERE expires_at IS NULL OR expires_at > ? ORDER BY accessed_at DESC LIMIT ?",
+                (time.time(), limit),
+            ).fetchall()
+        return [(key, CachedResponse(zlib.decompress(content), ctype, expires_at))
+                for key, content, ctype, expires_at in rows]
+
+    def compact(self):
+        """Drop expired rows and evict least recently used rows over the size cap"""
+        with self._lock:
+            expired = self._conn.execute(
+                "DELETE FROM responses WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                (time.time() - self.stale_retention,)
+            ).rowcount
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            evicted = 0
+            if total > self.max_bytes:
+                rows = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall()
+                doomed = []
+                for key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    doomed.append((key,))
+                    total -= size
+                self._conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+                evicted = len(doomed)
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        if expired or evicted:
+            logger.info(f"Disk cache compacted: {expired} expired, {evicted} evicted")
+
+    def stats(self):
+        with self._lock:
+            count, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return {"entries": count, "bytes": size}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,94 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+# Decimal places kept for latitude/longitude (4 places is about 11 m)
+COORDINATE_PRECISION = int(os.getenv("PROKERALA_COORDINATE_PRECISION", "4"))
+
+# Offset assumed for datetimes given without one
+DEFAULT_TIMEZONE = timezone(timedelta(hours=5, minutes=30))
+
+# Datetime formats accepted besides ISO 8601
+DATETIME_FORMATS = (
+    "%Y-%m-%d %I:%M %p",
+    "%Y-%m-%d %I:%M:%S %p",
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%d %H:%M:%S",
+)
+
+COORDINATE_PARAMS = ("coordinates", "girl_coordinates", "boy_coordinates")
+DATETIME_PARAMS = ("datetime", "girl_dob", "boy_dob")
+
+
+def canonical_coordinates(value):
+    """Normalize "lat,lon" to fixed precision, e.g. " 8.89320, 76.6141" -> "8.8932,76.6141" """
+    parts = str(value).split(",")
+    if len(parts) != 2:
+        raise ValueError(f"Invalid coordinates '{value}'. Please use format: Latitude,Longitude")
+    try:
+        lat, lon = float(parts[0]), float(parts[1])
+    except ValueError:
+        raise ValueError(f"Invalid coordinates '{value}'. Please use format: Latitude,Longitude")
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError(f"Coordinates out of range: '{value}'")
+    lat, lon = round(lat, COORDINATE_PRECISION), round(lon, COORDINATE_PRECISION)
+    # Avoid "-0.0" and trailing zeros so equal points always render the same
+    return f"{_format_number(lat)},{_format_number(lon)}"
+
+
+def parse_datetime(value):
+    """Parse "YYYY-MM-DD HH:MM AM/PM" or ISO 8601 into a timezone-aware datetime"""
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        text = str(value).strip()
+        dt = None
+        for fmt in DATETIME_FORMATS:
+            try:
+                dt = datetime.strptime(text, fmt)
+                break
+            except ValueError:
+                continue
+        if dt is None:
+            try:
+                dt = datetime.fromisoformat(text)
+            except ValueError:
+                raise ValueError(
+                    f"Invalid datetime '{value}'. Please use format: YYYY-MM-DD HH:MM AM/PM "
+                    "or YYYY-MM-DDTHH:MM:SS+05:30"
+                )
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=DEFAULT_TIMEZONE)
+    return dt.replace(microsecond=0)
+
+
+def canonical_datetime(value):
+    """Normalize a datetime to "YYYY-MM-DDTHH:MM:SS+HH:MM"
+
+    The caller's UTC offset is kept rather than converted to UTC, because
+    Prokerala renders times in the response in the offset of the request.
+    """
+    return parse_datetime(value).isoformat(timespec="seconds")
+
+
+def canonical_date(value):
+    """Normalize a datetime to midnight of its date, keeping the UTC offset"""
+    return parse_datetime(value).replace(hour=0, minute=0, second=0).isoformat(timespec="seconds")
+
+
+def canonical_params(params):
+    """Return a copy of request params with coordinates and datetimes normalized"""
+    result = dict(params)
+    for name in COORDINATE_PARAMS:
+        if name in result:
+            result[name] = canonical_coordinates(result[name])
+    for name in DATETIME_PARAMS:
+        if name in result:
+            result[name] = canonical_datetime(result[name])
+    if "sign" in result:
+        result["sign"] = str(result["sign"]).strip().lower()
+    return result
+
+
+def _format_number(value):
+    text = f"{value:.{COORDINATE_PRECISION}f}".rstrip("0").rstrip(".")
+    return "0" if text in ("-0", "") else text
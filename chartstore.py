@@ -0,0 +1,146 @@
+import gzip
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger("pyyan")
+
+
+class ChartStore:
+    """Content-addressed store for rendered charts
+
+    Chart bytes live in files named by their SHA-256 digest, so identical
+    charts requested with different params are stored once. A SQLite index
+    maps each chart params key to its digest and tracks last access for
+    LRU eviction down to max_bytes. Files are optionally gzip-compressed.
+    The directory can be shared by worker processes.
+    """
+
+    def __init__(self, root, max_bytes=256 * 1024 * 1024, compress=True):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(root, "blobs"), exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(root, "index.sqlite"), timeout=10,
+                                     check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS charts ("
+                "key TEXT PRIMARY KEY, digest TEXT NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS blobs ("
+                "digest TEXT PRIMARY KEY, media_type TEXT NOT NULL, size INTEGER NOT NULL, "
+                "stored_size INTEGER NOT NULL, compressed INTEGER NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS charts_accessed ON charts (accessed_at)")
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key):
+        """Return (digest, media_type) for a chart params key, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT charts.digest, blobs.media_type FROM charts JOIN blobs USING (digest) WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and not os.path.exists(self._blob_path(row[0])):
+                # File removed behind our back; forget the entry
+                self._conn.execute("DELETE FROM charts WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE charts SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        self.hits += 1
+        return row[0], row[1]
+
+    def put(self, key, content, media_type):
+        """Store chart bytes under a params key and return their digest"""
+        digest = hashlib.sha256(content).hexdigest()
+        path = self._blob_path(digest)
+        with self._lock:
+            known = self._conn.execute("SELECT 1 FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        if known is None or not os.path.exists(path):
+            data = gzip.compress(content, 6) if self.compress else content
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO blobs (digest, media_type, size, stored_size, compressed) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (digest, media_type, len(content), len(data), int(self.compress)),
+                )
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO charts (key, digest, accessed_at) VALUES (?, ?, ?)",
+                (key, digest, time.time()),
+            )
+        self.compact()
+        return digest
+
+    def read(self, digest):
+        """Return (content, media_type) for a digest, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT media_type, compressed FROM blobs WHERE digest = ?", (digest,)
+            ).fetchone()
+        if row is None:
+            return None
+        try:
+            with open(self._blob_path(digest), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        return (gzip.decompress(data) if row[1] else data), row[0]
+
+    def compact(self):
+        """Evict least recently used charts until the stored bytes fit max_bytes"""
+        with self._lock:
+            total = self._conn.execute("SELECT COALESCE(SUM(stored_size), 0) FROM blobs").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            # A blob's recency is that of its most recently used params key
+            rows = self._conn.execute(
+                "SELECT blobs.digest, blobs.stored_size FROM blobs LEFT JOIN charts USING (digest) "
+                "GROUP BY blobs.digest ORDER BY COALESCE(MAX(charts.accessed_at), 0)"
+            ).fetchall()
+            doomed = []
+            for digest, size in rows:
+                if total <= self.max_bytes:
+                    break
+                doomed.append(digest)
+                total -= size
+            for digest in doomed:
+                self._conn.execute("DELETE FROM charts WHERE digest = ?", (digest,))
+                self._conn.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+        for digest in doomed:
+            try:
+                os.remove(self._blob_path(digest))
+            except FileNotFoundError:
+                pass
+        logger.info(f"Chart store compacted: {len(doomed)} charts evicted")
+        return len(doomed)
+
+    def stats(self):
+        with self._lock:
+            keys = self._conn.execute("SELECT COUNT(*) FROM charts").fetchone()[0]
+            blobs, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(stored_size), 0) FROM blobs"
+            ).fetchone()
+        return {"keys": keys, "blobs": blobs, "bytes": size, "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _blob_path(self, digest):
+        # Whether the file is gzipped is recorded in the index, not the name
+        return os.path.join(self.root, "blobs", digest[:2], digest)
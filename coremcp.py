@@ -1,11 +1,30 @@
+import asyncio
+import functools
+import importlib.util
 import logging
-import requests
-import json
+import httpx
 import os
 import time
 from mcp.server.fastmcp import FastMCP, Context
-from datetime import datetime
-from pprint import pprint
+from mcp.server.fastmcp.resources import FunctionResource, ResourceTemplate
+from starlette.responses import PlainTextResponse
+from tokenstore import TokenStore
+from tracing import Tracer
+from metrics import MetricsRegistry, current_tool
+from datetime import timedelta
+from zoneinfo import ZoneInfo
+import jsonout
+from canonical import canonical_coordinates, canonical_date, canonical_datetime, canonical_params, parse_datetime
+from ratelimit import BATCH, INTERACTIVE, PREFETCH, Priority, RateLimiter
+from resilience import CircuitBreaker, backoff_delay, hedged
+from replay import MODES, REPLAY, FixtureStore, ReplayMissError
+from cache import DAY, ResponseCache, SqliteCache, make_cache_key
+from chartstore import ChartStore
+from prefetch import DailyPrefetcher
+import dosha
+import ephemeris
+import gazetteer
+import panchang
 
 # Configure logging with more detailed format
 logging.basicConfig(
@@ -18,17 +37,222 @@ logger = logging.getLogger("pyyan")
 mcp = FastMCP("Prokerala MCP")
 
 # Prokerala API credentials
-CLIENT_ID = "your client id here"
-CLIENT_SECRET = "your secret here"
-TOKEN_FILE_PATH = 'access_token.json'
-
-def print_api_info(title, data):
-    """Print API information in a formatted way"""
-    print("\n" + "="*50)
-    print(f"API {title}:")
-    print("="*50)
-    pprint(data)
-    print("="*50 + "\n")
+CLIENT_ID = os.getenv("CLIENT_ID", "your client id here")
+CLIENT_SECRET = os.getenv("CLIENT_SECRET", "your secret here")
+TOKEN_FILE_PATH = os.getenv("TOKEN_FILE_PATH", 'access_token.json')
+# Override to point the server at a local stand-in (see stubserver.py)
+API_BASE_URL = os.getenv("PROKERALA_API_BASE", "https://api.prokerala.com").rstrip("/")
+# Start a background token refresh this many seconds before expiry
+TOKEN_REFRESH_AHEAD = int(os.getenv("PROKERALA_TOKEN_REFRESH_AHEAD", "600"))
+
+# Upstream mode: live, record (live + save responses) or replay (serve saved responses, no network)
+UPSTREAM_MODE = os.getenv("PROKERALA_UPSTREAM_MODE", "live").lower()
+FIXTURE_PATH = os.getenv("PROKERALA_FIXTURE_PATH", "fixtures.sqlite")
+if UPSTREAM_MODE not in MODES:
+    raise ValueError(f"PROKERALA_UPSTREAM_MODE must be one of {', '.join(MODES)}")
+
+# Upstream call tracing: off, summary, headers or body
+TRACE_LEVEL = os.getenv("PROKERALA_TRACE", "off")
+TRACE_SAMPLE_RATE = float(os.getenv("PROKERALA_TRACE_SAMPLE_RATE", "1.0"))
+TRACE_MAX_BODY = int(os.getenv("PROKERALA_TRACE_MAX_BODY", "2048"))
+
+# Upstream HTTP connection pool settings
+HTTP_MAX_CONNECTIONS = int(os.getenv("PROKERALA_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("PROKERALA_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("PROKERALA_KEEPALIVE_EXPIRY", "30"))
+HTTP_TIMEOUT = float(os.getenv("PROKERALA_TIMEOUT", "15"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("PROKERALA_CONNECT_TIMEOUT", "5"))
+# HTTP/2 needs the optional "h2" package (pip install httpx[http2])
+HTTP2_ENABLED = (
+    os.getenv("PROKERALA_HTTP2", "1") == "1"
+    and importlib.util.find_spec("h2") is not None
+)
+
+# Per-endpoint read timeouts in seconds; other endpoints use PROKERALA_TIMEOUT
+ENDPOINT_TIMEOUTS = {
+    "/v2/astrology/panchang": 8,
+    "/v2/horoscope/daily": 8,
+    "/v2/astrology/kundli/advanced": 20,
+    "/v2/astrology/chart": 20,
+    "/v2/astrology/kundli-matching/advanced": 20,
+    "/v2/astrology/porutham/advanced": 20,
+}
+
+# Retries on 429/5xx and connection errors, with jittered exponential backoff
+RETRY_ATTEMPTS = int(os.getenv("PROKERALA_RETRY_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.getenv("PROKERALA_RETRY_BASE_DELAY", "0.25"))
+RETRY_MAX_DELAY = float(os.getenv("PROKERALA_RETRY_MAX_DELAY", "8"))
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Latency-critical endpoints get a second, hedged request if the first is slow (0 disables)
+HEDGE_DELAY = float(os.getenv("PROKERALA_HEDGE_DELAY", "0.75"))
+HEDGED_ENDPOINTS = {"/v2/astrology/panchang", "/v2/horoscope/daily"}
+
+# Circuit breaker: fail fast after consecutive upstream failures
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("PROKERALA_CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("PROKERALA_CIRCUIT_RESET_TIMEOUT", "30"))
+
+# Client-side rate limit; refined at runtime from X-RateLimit-* response headers
+RATE_LIMIT_PER_SECOND = float(os.getenv("PROKERALA_RATE_LIMIT_PER_SECOND", "10"))
+RATE_LIMIT_BURST = int(os.getenv("PROKERALA_RATE_LIMIT_BURST", "20"))
+RATE_LIMIT_WINDOW = int(os.getenv("PROKERALA_RATE_LIMIT_WINDOW", "60"))
+
+# Batch tools: concurrent upstream requests per tool call
+BATCH_CONCURRENCY = int(os.getenv("PROKERALA_BATCH_CONCURRENCY", "8"))
+PANCHANG_RANGE_MAX_DAYS = int(os.getenv("PROKERALA_PANCHANG_RANGE_MAX_DAYS", "366"))
+MATCH_MAX_CANDIDATES = int(os.getenv("PROKERALA_MATCH_MAX_CANDIDATES", "500"))
+
+# Response cache settings
+CACHE_ENABLED = os.getenv("PROKERALA_CACHE_ENABLED", "1") == "1"
+CACHE_MAX_ENTRIES = int(os.getenv("PROKERALA_CACHE_MAX_ENTRIES", "2048"))
+CACHE_MAX_BYTES = int(os.getenv("PROKERALA_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Optional persistent tier behind the memory cache; disabled when the path is empty
+DISK_CACHE_PATH = os.getenv("PROKERALA_DISK_CACHE_PATH", "")
+DISK_CACHE_MAX_BYTES = int(os.getenv("PROKERALA_DISK_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+DISK_CACHE_COMPACT_INTERVAL = int(os.getenv("PROKERALA_DISK_CACHE_COMPACT_INTERVAL", "300"))
+DISK_CACHE_WARM_ENTRIES = int(os.getenv("PROKERALA_DISK_CACHE_WARM_ENTRIES", "256"))
+
+# Derive dosha checks from a cached kundli or planet positions instead of calling upstream.
+# Off by default: the derivation uses simplified rules and omits exceptions and remedies
+LOCAL_DOSHA = os.getenv("PROKERALA_LOCAL_DOSHA", "0") == "1"
+
+# Compute English planet positions locally (needs numpy) instead of calling upstream
+LOCAL_EPHEMERIS = os.getenv("PROKERALA_LOCAL_EPHEMERIS", "0") == "1"
+if LOCAL_EPHEMERIS and not ephemeris.AVAILABLE:
+    logger.warning("PROKERALA_LOCAL_EPHEMERIS is set but numpy is not installed; using the API")
+    LOCAL_EPHEMERIS = False
+# Years the local ephemeris models are valid for
+EPHEMERIS_YEARS = (1800, 2050)
+
+# Compute panchang locally from yearly transition tables (needs numpy) instead of calling upstream
+LOCAL_PANCHANG = os.getenv("PROKERALA_LOCAL_PANCHANG", "0") == "1"
+if LOCAL_PANCHANG and not ephemeris.AVAILABLE:
+    logger.warning("PROKERALA_LOCAL_PANCHANG is set but numpy is not installed; using the API")
+    LOCAL_PANCHANG = False
+PANCHANG_TABLE_PATH = os.getenv("PROKERALA_PANCHANG_TABLE_PATH", "panchang_tables")
+
+# Offline place lookup for find_place; the index is built from the TSV on first use
+GAZETTEER_PATH = os.getenv("PROKERALA_GAZETTEER_PATH", gazetteer.DEFAULT_SOURCE)
+GAZETTEER_INDEX_PATH = os.getenv("PROKERALA_GAZETTEER_INDEX", "gazetteer.idx")
+
+# Rendered charts, stored by content digest and served as chart://<digest> resources
+CHART_STORE_PATH = os.getenv("PROKERALA_CHART_STORE_PATH", "charts")
+CHART_STORE_MAX_BYTES = int(os.getenv("PROKERALA_CHART_STORE_MAX_BYTES", str(256 * 1024 * 1024)))
+CHART_STORE_COMPRESS = os.getenv("PROKERALA_CHART_STORE_COMPRESS", "1") == "1"
+
+# Stale-while-revalidate: expired entries for these endpoints are served for up to
+# PROKERALA_STALE_WHILE_REVALIDATE seconds (0 disables) while a background refresh runs
+STALE_WHILE_REVALIDATE = int(os.getenv("PROKERALA_STALE_WHILE_REVALIDATE", "3600"))
+# Stale-if-error: expired entries for these endpoints are kept this many seconds and served
+# when upstream fails, answers 429/5xx or the circuit breaker is open (0 disables)
+STALE_IF_ERROR = int(os.getenv("PROKERALA_STALE_IF_ERROR", "86400"))
+STALE_ENDPOINTS = {
+    "/v2/astrology/panchang",
+    "/v2/astrology/calendar",
+    "/v2/astrology/auspicious-period",
+    "/v2/astrology/inauspicious-period",
+    "/v2/horoscope/daily",
+}
+
+# Endpoints whose answer depends only on the date: the time of day is dropped from
+# the request so every call for a day shares one cache entry
+DATE_ONLY_ENDPOINTS = {
+    "/v2/astrology/panchang",
+    "/v2/horoscope/daily",
+}
+
+# Cache TTL per endpoint path: None = forever (natal data), DAY = until local midnight.
+# Endpoints not listed here are never cached.
+CACHE_TTLS = {
+    "/v2/astrology/birth-details": None,
+    "/v2/astrology/kundli/advanced": None,
+    "/v2/astrology/planet-position": None,
+    "/v2/astrology/manglik-dosha": None,
+    "/v2/astrology/mangal-dosha": None,
+    "/v2/astrology/kaal-sarp-dosha": None,
+    "/v2/astrology/kundli-matching/advanced": None,
+    "/v2/astrology/porutham/advanced": None,
+    "/v2/astrology/papasamyam-check": None,
+    "/v2/astrology/panchang": DAY,
+    "/v2/astrology/calendar": DAY,
+    "/v2/astrology/auspicious-period": DAY,
+    "/v2/astrology/inauspicious-period": DAY,
+    "/v2/horoscope/daily": DAY,
+}
+
+ZODIAC_SIGNS = ["aries", "taurus", "gemini", "cancer", "leo", "virgo",
+                "libra", "scorpio", "sagittarius", "capricorn", "aquarius", "pisces"]
+
+# Prefetch each day's horoscopes and hot-location panchang shortly after local midnight
+PREFETCH_ENABLED = os.getenv("PROKERALA_PREFETCH", "0") == "1" and UPSTREAM_MODE != REPLAY
+# Timezones (IANA names) whose midnight triggers a daily horoscope prefetch for every sign
+PREFETCH_TIMEZONES = [name.strip() for name in os.getenv("PROKERALA_PREFETCH_TIMEZONES", "Asia/Kolkata").split(",") if name.strip()]
+# Panchang locations, "lat,lon@Area/City" separated by ";" (timezone defaults to the first of PREFETCH_TIMEZONES)
+PREFETCH_LOCATIONS = os.getenv("PROKERALA_PREFETCH_LOCATIONS", "")
+PREFETCH_DELAY = int(os.getenv("PROKERALA_PREFETCH_DELAY", "300"))
+PREFETCH_CONCURRENCY = int(os.getenv("PROKERALA_PREFETCH_CONCURRENCY", "4"))
+
+_http_client = None
+_http_client_loop = None
+
+metrics = MetricsRegistry()
+metrics.describe("prokerala_tool_calls_total", "counter", "Tool calls by tool")
+metrics.describe("prokerala_tool_errors_total", "counter", "Tool calls that returned an error")
+metrics.describe("prokerala_tool_duration_seconds", "histogram", "Tool call latency")
+metrics.describe("prokerala_tool_phase_seconds", "histogram", "Time spent per phase (auth, upstream, decode, serialize) of a tool call")
+metrics.describe("prokerala_tool_response_bytes_total", "counter", "Bytes returned by tools")
+metrics.describe("prokerala_upstream_requests_total", "counter", "Upstream HTTP requests by endpoint and status")
+metrics.describe("prokerala_upstream_errors_total", "counter", "Upstream transport errors by endpoint")
+metrics.describe("prokerala_upstream_request_seconds", "histogram", "Upstream HTTP latency by endpoint")
+metrics.describe("prokerala_upstream_response_bytes_total", "counter", "Bytes received from upstream by endpoint")
+metrics.describe("prokerala_local_ephemeris_total", "counter", "Planet positions computed locally instead of by upstream")
+metrics.describe("prokerala_local_panchang_total", "counter", "Panchang days computed locally instead of by upstream")
+metrics.describe("prokerala_stale_if_error_total", "counter", "Expired cache entries served because upstream failed")
+metrics.describe("prokerala_prefetch_total", "counter", "Responses prefetched ahead of the daily peak by kind and result")
+metrics.describe("prokerala_dosha_derived_total", "counter", "Dosha checks answered locally instead of by upstream")
+fixture_store = FixtureStore(FIXTURE_PATH) if UPSTREAM_MODE != "live" else None
+tracer = Tracer(TRACE_LEVEL, sample_rate=TRACE_SAMPLE_RATE, max_body=TRACE_MAX_BODY)
+token_store = TokenStore(TOKEN_FILE_PATH)
+circuit_breaker = CircuitBreaker(failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT)
+rate_limiter = RateLimiter(rate=RATE_LIMIT_PER_SECOND, burst=RATE_LIMIT_BURST, window=RATE_LIMIT_WINDOW)
+response_cache = ResponseCache(
+    max_entries=CACHE_MAX_ENTRIES,
+    max_bytes=CACHE_MAX_BYTES,
+    disk=SqliteCache(
+        DISK_CACHE_PATH, max_bytes=DISK_CACHE_MAX_BYTES, stale_retention=max(STALE_WHILE_REVALIDATE, STALE_IF_ERROR)
+    ) if CACHE_ENABLED and DISK_CACHE_PATH else None,
+    compact_interval=DISK_CACHE_COMPACT_INTERVAL,
+    stale_retention=max(STALE_WHILE_REVALIDATE, STALE_IF_ERROR),
+)
+response_cache.warm_from_disk(DISK_CACHE_WARM_ENTRIES)
+panchang_tables = panchang.PanchangTables(PANCHANG_TABLE_PATH) if LOCAL_PANCHANG else None
+places = gazetteer.Gazetteer(GAZETTEER_PATH, GAZETTEER_INDEX_PATH)
+_chart_store = None
+
+def get_http_client():
+    """Get the shared keep-alive HTTP client, creating it for the running event loop"""
+    global _http_client, _http_client_loop
+    loop = asyncio.get_running_loop()
+    if _http_client is None or _http_client.is_closed or _http_client_loop is not loop:
+        _http_client = httpx.AsyncClient(
+            http2=HTTP2_ENABLED,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        )
+        _http_client_loop = loop
+        logger.info(f"Created upstream HTTP client (http2={HTTP2_ENABLED}, max_connections={HTTP_MAX_CONNECTIONS})")
+    return _http_client
+
+def get_chart_store():
+    """Open the chart store on first use so importing the server doesn't create it"""
+    global _chart_store
+    if _chart_store is None:
+        _chart_store = ChartStore(CHART_STORE_PATH, max_bytes=CHART_STORE_MAX_BYTES, compress=CHART_STORE_COMPRESS)
+    return _chart_store
 
 def is_token_expired(token_data):
     """Check if token is expired or will expire soon (within 5 minutes)"""
@@ -41,19 +265,16 @@ def save_token_data(token_data):
     """Save token data with timestamps"""
     token_data['created_at'] = int(time.time())
     token_data['expires_at'] = token_data['created_at'] + token_data['expires_in']
-    with open(TOKEN_FILE_PATH, 'w') as f:
-        json.dump(token_data, f)
+    token_store.write(token_data)
     logger.info("Token data saved successfully")
 
 def load_token_data():
     """Load token data and check if it's expired"""
-    if not os.path.exists(TOKEN_FILE_PATH):
-        logger.warning("No token file found")
-        return None
-        
     try:
-        with open(TOKEN_FILE_PATH, 'r') as f:
-            token_data = json.load(f)
+        token_data = token_store.read()
+        if token_data is None:
+            logger.warning("No token file found")
+            return None
             
         if is_token_expired(token_data):
             logger.info("Token expired or will expire soon")
@@ -65,25 +286,24 @@ def load_token_data():
         logger.error(f"Error loading token data: {str(e)}")
         return None
 
-def get_access_token():
+async def get_access_token():
     """Get access token from Prokerala API"""
+    if UPSTREAM_MODE == REPLAY:
+        # Replayed responses don't depend on the token, so don't touch the network
+        return {"access_token": "replay", "expires_in": 86400, "expires_at": int(time.time()) + 86400}
     try:
         logger.info("Attempting to get new access token from Prokerala API")
-        response = requests.post(
-            "https://api.prokerala.com/token",
-            data={
-                "grant_type": "client_credentials",
-                "client_id": CLIENT_ID,
-                "client_secret": CLIENT_SECRET,
-            },
-        )
-        
-        print_api_info("Token Request", {
-            "url": "https://api.prokerala.com/token",
-            "status_code": response.status_code,
-            "headers": dict(response.headers),
-            "response": response.json() if response.status_code == 200 else response.text
-        })
+        token_params = {
+            "grant_type": "client_credentials",
+            "client_id": CLIENT_ID,
+            "client_secret": CLIENT_SECRET,
+        }
+        started = time.perf_counter()
+        response = await get_http_client().post(f"{API_BASE_URL}/token", data=token_params)
+        if tracer.sampled():
+            # The body holds the new token, so it is never traced
+            tracer.upstream("post", f"{API_BASE_URL}/token", token_params, {},
+                            response=response, elapsed=time.perf_counter() - started, include_body=False)
         
         if response.status_code == 200:
             token_data = response.json()
@@ -98,149 +318,698 @@ def get_access_token():
         logger.error(f"Error getting access token: {str(e)}", exc_info=True)
         return None
 
-def get_auth_headers():
+class TokenManager:
+    """Keep the access token in memory and refresh it with at most one request in flight"""
+
+    def __init__(self, refresh_ahead=TOKEN_REFRESH_AHEAD):
+        self.refresh_ahead = refresh_ahead
+        self._token_data = None
+        self._loaded = False
+        self._refresh_task = None
+
+    async def get_token_data(self):
+        """Return a valid token, refreshing it if needed"""
+        if not self._loaded:
+            # Only touch the token file once, on cold start
+            self._token_data = load_token_data()
+            self._loaded = True
+
+        token_data = self._token_data
+        if is_token_expired(token_data):
+            return await self.refresh()
+
+        if int(time.time()) >= token_data['expires_at'] - self.refresh_ahead:
+            # Still valid: refresh in the background, keep serving the current token
+            self._start_refresh()
+        return token_data
+
+    async def refresh(self, stale_auth=None):
+        """Refresh the token, joining a refresh that is already in flight
+
+        stale_auth is the Authorization header that was rejected; if the token
+        has changed since then, the newer token is returned without a request.
+        """
+        current = self._token_data
+        if stale_auth and current and not is_token_expired(current):
+            if stale_auth != f"Bearer {current['access_token']}":
+                return current
+        token_data = await asyncio.shield(self._start_refresh(stale_auth))
+        if stale_auth and token_data and stale_auth == f"Bearer {token_data['access_token']}":
+            # Joined a refresh that didn't know about the 401 and kept the rejected token
+            token_data = await asyncio.shield(self._start_refresh(stale_auth))
+        return token_data
+
+    def _start_refresh(self, stale_auth=None):
+        task = self._refresh_task
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            logger.info("Starting access token refresh")
+            task = self._refresh_task = asyncio.create_task(self._do_refresh(stale_auth))
+        return task
+
+    async def _do_refresh(self, stale_auth=None):
+        async with token_store.locked():
+            # Another worker may have refreshed while we waited for the lock
+            token_data = load_token_data() if token_store.changed() else None
+            if token_data and not self._should_refresh(token_data, stale_auth):
+                logger.info("Using access token refreshed by another worker")
+            else:
+                token_data = await get_access_token()
+        if token_data:
+            self._token_data = token_data
+        return token_data
+
+    def _should_refresh(self, token_data, stale_auth=None):
+        if is_token_expired(token_data):
+            return True
+        if stale_auth == f"Bearer {token_data['access_token']}":
+            # The file still holds the token that was just rejected
+            return True
+        current = self._token_data
+        if current and current['access_token'] != token_data['access_token']:
+            # Newer than the one we hold (or the one that got a 401)
+            return False
+        return int(time.time()) >= token_data['expires_at'] - self.refresh_ahead
+
+
+token_manager = TokenManager()
+
+async def get_auth_headers():
     """Get authorization headers with token refresh if needed"""
-    # Try to load existing token
-    token_data = load_token_data()
-    
+    with metrics.phase("auth"):
+        token_data = await token_manager.get_token_data()
     if not token_data:
-        # No valid token, get new one
-        token_data = get_access_token()
-        if not token_data:
-            raise Exception("Failed to get access token")
-            
+        raise Exception("Failed to get access token")
     return {"Authorization": f"Bearer {token_data['access_token']}"}
 
-def make_api_request(url, headers, params, method="get"):
-    """Make API request with automatic token refresh"""
-    try:
-        # First attempt
-        if method.lower() == "get":
-            response = requests.get(url, headers=headers, params=params)
+class SingleFlight:
+    """Share one in-flight call between concurrent callers with the same key
+
+    func is called with a Priority; a caller joining with a higher priority
+    promotes the shared call in the rate limiter queue.
+    """
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self._inflight = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key, func, priority=INTERACTIVE):
+        flight = self._inflight.get(key)
+        if flight is None or flight[0].get_loop() is not asyncio.get_running_loop():
+            request = Priority(priority)
+            task = asyncio.create_task(func(request))
+            self._inflight[key] = (task, request)
+            task.add_done_callback(lambda t: self._forget(key, t))
+            self.started += 1
         else:
-            response = requests.post(url, headers=headers, data=params)
-        
-        # If token expired (401), refresh and retry once
-        if response.status_code == 401:
-            logger.info("Token expired, attempting to refresh...")
-            new_token_data = get_access_token()
-            if new_token_data:
-                new_headers = {"Authorization": f"Bearer {new_token_data['access_token']}"}
-                if method.lower() == "get":
-                    response = requests.get(url, headers=new_headers, params=params)
-                else:
-                    response = requests.post(url, headers=new_headers, data=params)
-            else:
-                logger.error("Failed to refresh token")
-                
+            task, request = flight
+            self.limiter.promote(request, priority)
+            self.coalesced += 1
+        # Shield so one cancelled caller doesn't cancel the request for the others
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        flight = self._inflight.get(key)
+        if flight is not None and flight[0] is task:
+            del self._inflight[key]
+
+    def stats(self):
+        return {"in_flight": len(self._inflight), "started": self.started, "coalesced": self.coalesced}
+
+
+upstream_flights = SingleFlight(rate_limiter)
+# Strong references to background revalidation tasks so they aren't garbage collected
+_background_tasks = set()
+
+def cached_api_response(url, params, cached):
+    """Rebuild an httpx.Response from a cache entry, flagging stale JSON bodies with "stale": true"""
+    content = cached.content
+    if cached.is_expired() and "json" in cached.content_type:
+        content = jsonout.dumps({**jsonout.loads(content), "stale": True}, pretty=False).encode()
+    return httpx.Response(
+        200,
+        content=content,
+        headers={"Content-Type": cached.content_type, "X-Cache": "STALE" if cached.is_expired() else "HIT"},
+        request=httpx.Request("GET", url, params=params),
+    )
+
+def request_params(endpoint, params):
+    """Normalize params so equivalent requests share one cache key"""
+    params = canonical_params(params)
+    if endpoint in DATE_ONLY_ENDPOINTS and "datetime" in params:
+        params["datetime"] = canonical_date(params["datetime"])
+    return params
+
+async def make_api_request(url, headers, params, method="get", priority=INTERACTIVE):
+    """Make API request with response caching, request coalescing, rate limiting and automatic token refresh
+
+    priority orders requests queued by the rate limiter: INTERACTIVE tool
+    calls go ahead of BATCH and PREFETCH work.
+    """
+    with metrics.phase("upstream"):
+        return await _make_api_request(url, headers, params, method, priority)
+
+async def _make_api_request(url, headers, params, method, priority):
+    endpoint = httpx.URL(url).path
+    params = request_params(endpoint, params)
+    if method.lower() != "get":
+        return await _send_api_request(url, headers, params, method, priority)
+
+    cache_key = make_cache_key(endpoint, params)
+    cacheable = CACHE_ENABLED and endpoint in CACHE_TTLS
+    max_stale = STALE_WHILE_REVALIDATE if endpoint in STALE_ENDPOINTS else 0
+    cached = None
+    if cacheable:
+        cached = await response_cache.lookup(cache_key, endpoint, max_stale)
+        if cached is not None and not cached.is_expired():
+            return cached_api_response(url, params, cached)
+
+    async def fetch(request):
+        response = await _send_api_request(url, headers, params, method, request)
+        if cacheable and response.status_code == 200:
+            await response_cache.store(
+                cache_key,
+                response.content,
+                response.headers.get("Content-Type", "application/json"),
+                CACHE_TTLS[endpoint],
+                day=parse_datetime(params["datetime"]) if "datetime" in params else None,
+            )
         return response
+
+    if cached is not None:
+        # Serve the stale copy now and refresh it in the background, behind live calls
+        task = asyncio.create_task(upstream_flights.do(cache_key, fetch, PREFETCH))
+        _background_tasks.add(task)
+        task.add_done_callback(_finish_background_task)
+        return cached_api_response(url, params, cached)
+
+    stale_if_error = STALE_IF_ERROR if cacheable and endpoint in STALE_ENDPOINTS else 0
+    if not stale_if_error:
+        # Identical concurrent requests share one upstream call
+        return await upstream_flights.do(cache_key, fetch, priority)
+
+    try:
+        response = await upstream_flights.do(cache_key, fetch, priority)
     except Exception as e:
-        logger.error(f"API request error: {str(e)}")
-        raise e
+        fallback = await response_cache.peek(cache_key, stale_if_error)
+        if fallback is None:
+            raise
+        return serve_stale_if_error(url, params, endpoint, fallback, str(e))
+    if response.status_code == 429 or response.status_code >= 500:
+        fallback = await response_cache.peek(cache_key, stale_if_error)
+        if fallback is not None:
+            return serve_stale_if_error(url, params, endpoint, fallback, f"HTTP {response.status_code}")
+    return response
+
+def serve_stale_if_error(url, params, endpoint, cached, reason):
+    """Answer from an expired cache entry because upstream is failing"""
+    logger.warning(f"Serving stale {endpoint} response, upstream failed: {reason}")
+    metrics.inc("prokerala_stale_if_error_total", {"endpoint": endpoint})
+    return cached_api_response(url, params, cached)
+
+def _finish_background_task(task):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Background revalidation failed: {str(task.exception())}")
+
+async def _send_api_request(url, headers, params, method="get", priority=INTERACTIVE):
+    """Send API request with retries, hedging, circuit breaking and automatic token refresh"""
+    endpoint = httpx.URL(url).path
+    attempts = RETRY_ATTEMPTS + 1
+    for attempt in range(attempts):
+        circuit_breaker.check()
+        last_attempt = attempt == attempts - 1
+        try:
+            response = await _send_hedged(endpoint, url, headers, params, method, priority)
+
+            # If token expired (401), refresh and retry once
+            if response.status_code == 401:
+                logger.info("Token expired, attempting to refresh...")
+                new_token_data = await token_manager.refresh(stale_auth=headers.get("Authorization"))
+                if new_token_data:
+                    headers = {**headers, "Authorization": f"Bearer {new_token_data['access_token']}"}
+                    response = await _send_hedged(endpoint, url, headers, params, method, priority)
+                else:
+                    logger.error("Failed to refresh token")
+        except httpx.TransportError as e:
+            circuit_breaker.record_failure()
+            if last_attempt:
+                logger.error(f"API request error: {str(e)}")
+                raise
+            logger.warning(f"API request to {endpoint} failed ({type(e).__name__}: {str(e)}), retrying")
+            await asyncio.sleep(backoff_delay(attempt, RETRY_BASE_DELAY, RETRY_MAX_DELAY))
+            continue
+
+        if response.status_code not in RETRY_STATUS_CODES:
+            circuit_breaker.record_success()
+            return response
+
+        if response.status_code >= 500:
+            circuit_breaker.record_failure()
+        else:
+            # 429: upstream is healthy, the rate limiter has already paused
+            circuit_breaker.record_success()
+        if last_attempt:
+            return response
+        logger.warning(f"API request to {endpoint} returned {response.status_code}, retrying")
+        await asyncio.sleep(backoff_delay(attempt, RETRY_BASE_DELAY, RETRY_MAX_DELAY))
+
+async def _send_hedged(endpoint, url, headers, params, method, priority):
+    """Wait for a rate limiter slot and send, racing a second copy for latency-critical GET endpoints
+
+    The hedge timer starts once the slot is granted, and the second copy is
+    only sent if another slot is free without queueing, so time spent in the
+    limiter queue or a 429 pause never doubles upstream requests.
+    """
+    await rate_limiter.acquire(priority)
+    send = lambda: _send_once(endpoint, url, headers, params, method)
+    if HEDGE_DELAY > 0 and method.lower() == "get" and endpoint in HEDGED_ENDPOINTS:
+        return await hedged(send, HEDGE_DELAY, can_hedge=rate_limiter.try_acquire)
+    return await send()
+
+async def _send_once(endpoint, url, headers, params, method):
+    """Send one request and learn quota from the response"""
+    timeout = httpx.USE_CLIENT_DEFAULT
+    if endpoint in ENDPOINT_TIMEOUTS:
+        timeout = httpx.Timeout(ENDPOINT_TIMEOUTS[endpoint], connect=HTTP_CONNECT_TIMEOUT)
+    traced = tracer.sampled()
+    started = time.perf_counter()
+    try:
+        response = await _http_send(endpoint, url, headers, params, method, timeout)
+    except httpx.TransportError as e:
+        elapsed = time.perf_counter() - started
+        metrics.inc("prokerala_upstream_errors_total", {"endpoint": endpoint, "error": type(e).__name__})
+        metrics.observe("prokerala_upstream_request_seconds", {"endpoint": endpoint}, elapsed)
+        if traced:
+            tracer.upstream(method, url, params, headers, elapsed=elapsed, error=e)
+        raise
+    elapsed = time.perf_counter() - started
+    metrics.inc("prokerala_upstream_requests_total", {"endpoint": endpoint, "status": str(response.status_code)})
+    metrics.observe("prokerala_upstream_request_seconds", {"endpoint": endpoint}, elapsed)
+    metrics.inc("prokerala_upstream_response_bytes_total", {"endpoint": endpoint}, len(response.content))
+    if traced:
+        tracer.upstream(method, url, params, headers, response=response, elapsed=elapsed)
+    rate_limiter.update_from_headers(response.status_code, response.headers)
+    return response
+
+async def _http_send(endpoint, url, headers, params, method, timeout):
+    """Send one request over the network, or record/replay it per PROKERALA_UPSTREAM_MODE"""
+    fixture_key = None
+    if fixture_store is not None:
+        fixture_key = f"{method.upper()} {make_cache_key(endpoint, params)}"
+        if UPSTREAM_MODE == REPLAY:
+            fixture = await asyncio.to_thread(fixture_store.get, fixture_key)
+            if fixture is None:
+                raise ReplayMissError(f"No recorded response for {fixture_key}")
+            status, content_type, body = fixture
+            return httpx.Response(
+                status,
+                content=body,
+                headers={"Content-Type": content_type},
+                request=httpx.Request(method.upper(), url),
+            )
+
+    client = get_http_client()
+    if method.lower() == "get":
+        response = await client.get(url, headers=headers, params=params, timeout=timeout)
+    else:
+        response = await client.post(url, headers=headers, data=params, timeout=timeout)
+
+    # Transient failures and auth errors aren't worth replaying
+    if fixture_key is not None and response.status_code != 401 and response.status_code not in RETRY_STATUS_CODES:
+        await asyncio.to_thread(
+            fixture_store.put,
+            fixture_key,
+            response.status_code,
+            response.headers.get("Content-Type", "application/json"),
+            response.content,
+        )
+    return response
 
 def format_datetime(dt_str: str) -> str:
-    """Format datetime string to ISO format with timezone"""
+    """Format datetime string (YYYY-MM-DD HH:MM AM/PM or ISO) to ISO format with timezone"""
     try:
-        # Try parsing the input datetime
-        dt = datetime.strptime(dt_str, "%Y-%m-%d %I:%M %p")
-        # Convert to ISO format with timezone
-        return dt.strftime("%Y-%m-%dT%H:%M:%S+05:30")
+        return canonical_datetime(dt_str)
     except ValueError as e:
         logger.error(f"Error parsing datetime: {str(e)}")
-        raise ValueError("Invalid datetime format. Please use format: YYYY-MM-DD HH:MM AM/PM")
+        raise
+
+async def run_bounded(items, worker, limit=BATCH_CONCURRENCY, ctx=None):
+    """Run worker(item) for every item with at most `limit` running at once
+
+    Results come back in input order. Progress is reported through the MCP
+    context when one is given.
+    """
+    semaphore = asyncio.Semaphore(limit)
+    total = len(items)
+    completed = 0
+
+    async def run_one(item):
+        nonlocal completed
+        async with semaphore:
+            result = await worker(item)
+        completed += 1
+        if ctx is not None:
+            await ctx.report_progress(completed, total)
+        return result
+
+    return await asyncio.gather(*(run_one(item) for item in items))
+
+def local_planet_positions(coordinates, datetime_str):
+    """Planet-position "data" from the local ephemeris, or None to use the API"""
+    if not LOCAL_EPHEMERIS:
+        return None
+    dt = parse_datetime(datetime_str)
+    if not EPHEMERIS_YEARS[0] <= dt.year < EPHEMERIS_YEARS[1]:
+        return None
+    latitude, longitude = (float(part) for part in canonical_coordinates(coordinates).split(","))
+    try:
+        data = ephemeris.planet_position_data(dt, latitude, longitude)
+    except Exception as e:
+        logger.error(f"Local ephemeris failed, using the API: {str(e)}")
+        return None
+    metrics.inc("prokerala_local_ephemeris_total")
+    return data
+
+async def local_panchang(coordinates, day_times):
+    """Panchang "data" for each day from the local tables, or None to use the API
+
+    Runs in a thread because the first call for a year builds its table.
+    """
+    if not LOCAL_PANCHANG:
+        return None
+    if not all(EPHEMERIS_YEARS[0] <= dt.year < EPHEMERIS_YEARS[1] for dt in day_times):
+        return None
+    latitude, longitude = (float(part) for part in canonical_coordinates(coordinates).split(","))
+
+    def compute():
+        return panchang.days_panchang(panchang_tables, [dt.date() for dt in day_times], latitude, longitude,
+                                      day_times[0].tzinfo)
+
+    try:
+        days = await asyncio.to_thread(compute)
+    except Exception as e:
+        logger.error(f"Local panchang failed, using the API: {str(e)}")
+        return None
+    metrics.inc("prokerala_local_panchang_total", value=len(days))
+    return days
+
+async def cached_data(endpoint, params):
+    """The "data" of a fresh cached JSON response, or None"""
+    entry = await response_cache.peek(make_cache_key(endpoint, request_params(endpoint, params)))
+    if entry is None or "json" not in entry.content_type:
+        return None
+    return jsonout.loads(entry.content).get("data")
+
+async def local_dosha(kind, url, params):
+    """Derive a dosha check from a cached kundli or planet positions for the same birth
+
+    Returns None (so the caller goes upstream) when disabled, when the dosha
+    response itself is cached, for non-English requests, or when nothing
+    usable is cached.
+    """
+    if not (LOCAL_DOSHA and CACHE_ENABLED) or params.get("la", "en") != "en":
+        return None
+    endpoint = httpx.URL(url).path
+    if await response_cache.peek(make_cache_key(endpoint, request_params(endpoint, params))) is not None:
+        return None
+    base = {"ayanamsa": 1, "coordinates": params["coordinates"], "datetime": params["datetime"]}
+    kundli = await cached_data("/v2/astrology/kundli/advanced", base)
+    data = dosha.derive(kind, kundli)
+    if data is None:
+        # Longitudes don't depend on the language, so any cached language will do
+        for language in ("en", "ml"):
+            planets = await cached_data("/v2/astrology/planet-position", {**base, "la": language})
+            data = dosha.derive(kind, kundli, planets)
+            if data is not None:
+                break
+    if data is None:
+        data = dosha.derive(kind, kundli, local_planet_positions(params["coordinates"], params["datetime"]))
+    if data is not None:
+        metrics.inc("prokerala_dosha_derived_total", {"dosha": kind})
+    return data
+
+def derived_response_json(data, fields=None):
+    """Serialize a locally derived result in the upstream response envelope"""
+    with metrics.phase("serialize"):
+        return jsonout.dumps(jsonout.project_response({"status": "ok", "source": "local", "data": data}, fields))
+
+def prefetch_locations():
+    """[(coordinates, ZoneInfo)] from PROKERALA_PREFETCH_LOCATIONS"""
+    locations = []
+    for item in PREFETCH_LOCATIONS.split(";"):
+        if not item.strip():
+            continue
+        coordinates, _, zone = item.partition("@")
+        locations.append((canonical_coordinates(coordinates), ZoneInfo(zone.strip() or PREFETCH_TIMEZONES[0])))
+    return locations
+
+async def prefetch_request(kind, endpoint, params):
+    """Fetch a response into the cache at PREFETCH priority"""
+    try:
+        headers = await get_auth_headers()
+        response = await make_api_request(f"{API_BASE_URL}{endpoint}", headers=headers, params=params, priority=PREFETCH)
+        if response.status_code != 200:
+            raise Exception(f"API Error: {response.status_code}")
+    except Exception:
+        metrics.inc("prokerala_prefetch_total", {"kind": kind, "result": "error"})
+        raise
+    metrics.inc("prokerala_prefetch_total", {"kind": kind, "result": "ok"})
+
+async def prefetch_panchang(coordinates, midnight):
+    """Build the local panchang table for the year, or fetch the day upstream"""
+    if await local_panchang(coordinates, [midnight]) is not None:
+        metrics.inc("prokerala_prefetch_total", {"kind": "panchang", "result": "local"})
+        return
+    await prefetch_request("panchang", "/v2/astrology/panchang",
+                           {"ayanamsa": 1, "coordinates": coordinates, "datetime": midnight.isoformat()})
+
+def prefetch_jobs(zone, midnight):
+    """Daily horoscopes for every sign, and panchang for the hot locations in this timezone"""
+    jobs = []
+    if str(zone) in PREFETCH_TIMEZONES:
+        jobs.extend(
+            ("horoscope", functools.partial(prefetch_request, "horoscope", "/v2/horoscope/daily",
+                                            {"datetime": midnight.isoformat(), "sign": sign}))
+            for sign in ZODIAC_SIGNS
+        )
+    jobs.extend(
+        ("panchang", functools.partial(prefetch_panchang, coordinates, midnight))
+        for coordinates, location_zone in prefetch_locations()
+        if location_zone == zone
+    )
+    return jobs
+
+prefetcher = None
+if PREFETCH_ENABLED:
+    # Hot locations can name timezones that have no horoscope prefetch of their own
+    _prefetch_zones = {name: ZoneInfo(name) for name in PREFETCH_TIMEZONES}
+    for _, _zone in prefetch_locations():
+        _prefetch_zones.setdefault(str(_zone), _zone)
+    prefetcher = DailyPrefetcher(_prefetch_zones.values(), prefetch_jobs, delay=PREFETCH_DELAY, concurrency=PREFETCH_CONCURRENCY)
+
+def start_prefetch():
+    """Start the daily prefetcher on the running loop (servers started with `fastmcp run` have no startup hook)"""
+    if prefetcher is not None:
+        prefetcher.ensure_started()
+
+def chart_key(params):
+    """Chart store key: the canonical chart params"""
+    return make_cache_key("/v2/astrology/chart", canonical_params(params))
+
+async def stored_chart(params):
+    """Return (uri, content, media_type) for a chart already in the store, or None"""
+    found = await asyncio.to_thread(get_chart_store().lookup, chart_key(params))
+    if found is None:
+        return None
+    digest, media_type = found
+    stored = await asyncio.to_thread(get_chart_store().read, digest)
+    if stored is None:
+        return None
+    return f"chart://{digest}", stored[0], media_type
+
+async def store_chart(params, response):
+    """Save a rendered chart response and return its chart:// URI"""
+    media_type = response.headers.get("Content-Type", "").split(";")[0].strip()
+    digest = await asyncio.to_thread(get_chart_store().put, chart_key(params), response.content, media_type)
+    return f"chart://{digest}"
+
+def compact_json(data, fields=None):
+    """Serialize a tool result without whitespace, keeping only `fields` if given"""
+    with metrics.phase("serialize"):
+        return jsonout.dumps(jsonout.project(data, fields), pretty=False)
+
+def dump_response_json(response, ensure_ascii=True, fields=None):
+    """Decode an upstream JSON response and re-serialize it for the tool result
+
+    Args:
+        fields: Comma-separated dotted paths within "data" to keep (e.g. "nakshatra_details,mangal_dosha.has_dosha")
+    """
+    with metrics.phase("decode"):
+        data = jsonout.loads(response.content)
+    with metrics.phase("serialize"):
+        return jsonout.dumps(jsonout.project_response(data, fields), ensure_ascii=ensure_ascii)
+
+def instrument_tool(func):
+    """Record call count, errors, latency and output size for a tool"""
+    labels = {"tool": func.__name__}
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        start_prefetch()
+        token = current_tool.set(func.__name__)
+        started = time.perf_counter()
+        try:
+            result = await func(*args, **kwargs)
+        except Exception:
+            metrics.inc("prokerala_tool_errors_total", labels)
+            raise
+        finally:
+            metrics.observe("prokerala_tool_duration_seconds", labels, time.perf_counter() - started)
+            metrics.inc("prokerala_tool_calls_total", labels)
+            current_tool.reset(token)
+        if isinstance(result, str):
+            if result.startswith(("Error:", "API Error:")):
+                metrics.inc("prokerala_tool_errors_total", labels)
+            metrics.inc("prokerala_tool_response_bytes_total", labels, len(result.encode()))
+        return result
+
+    return wrapper
+
+def metrics_gauges():
+    """Point-in-time values for the metrics endpoint"""
+    cache_stats = response_cache.stats()
+    yield ("prokerala_cache_entries", None, cache_stats["entries"], "Responses held in the memory cache")
+    yield ("prokerala_cache_bytes", None, cache_stats["bytes"], "Bytes held in the memory cache")
+    yield ("prokerala_cache_hit_ratio", None, cache_stats["hit_ratio"], "Cache hits (memory or disk) over lookups")
+    limiter = rate_limiter.stats()
+    for priority, depth in limiter["queue_depth"].items():
+        yield ("prokerala_rate_limit_queue_depth", {"priority": priority}, depth, "Requests waiting for a rate limit slot")
+    if _chart_store is not None:
+        yield ("prokerala_chart_store_bytes", None, _chart_store.stats()["bytes"], "Bytes held in the chart store")
+    circuit = circuit_breaker.stats()
+    yield ("prokerala_circuit_open", None, circuit["state"] != "closed", "1 while the circuit breaker is open or half-open")
+    yield ("prokerala_circuit_consecutive_failures", None, circuit["consecutive_failures"], "Consecutive upstream failures counted by the circuit breaker")
+
+def metrics_counters():
+    """Running totals kept by the cache, limiter and stores, for the metrics endpoint"""
+    cache_stats = response_cache.stats()
+    for field in ("hits", "disk_hits", "misses"):
+        for endpoint, counts in cache_stats["endpoints"].items():
+            yield (f"prokerala_cache_{field}_total", {"endpoint": endpoint}, counts[field], f"Cache {field.replace('_', ' ')} by endpoint")
+    yield ("prokerala_cache_stale_hits_total", None, cache_stats["stale_hits"], "Stale entries served while revalidating")
+    yield ("prokerala_cache_evictions_total", None, cache_stats["evictions"], "Memory cache LRU evictions")
+    yield ("prokerala_coalesced_requests_total", None, upstream_flights.stats()["coalesced"], "Requests that joined an identical in-flight request")
+    for priority, seconds in rate_limiter.stats()["wait_seconds_total"].items():
+        yield ("prokerala_rate_limit_wait_seconds_total", {"priority": priority}, seconds, "Total time spent waiting for a rate limit slot")
+    if _chart_store is not None:
+        charts = _chart_store.stats()
+        yield ("prokerala_chart_store_hits_total", None, charts["hits"], "Charts served from the chart store")
+        yield ("prokerala_chart_store_misses_total", None, charts["misses"], "Charts fetched from upstream")
+    yield ("prokerala_circuit_opened_total", None, circuit_breaker.stats()["times_opened"], "Times the circuit breaker has opened")
+    if prefetcher is not None:
+        yield ("prokerala_prefetch_runs_total", None, prefetcher.runs, "Daily prefetch runs completed")
+    if fixture_store is not None:
+        yield ("prokerala_fixture_hits_total", None, fixture_store.hits, "Requests served from recorded responses")
+        yield ("prokerala_fixture_misses_total", None, fixture_store.misses, "Replayed requests with no recorded response")
+        yield ("prokerala_fixture_recorded_total", None, fixture_store.recorded, "Responses recorded this run")
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics_endpoint(request):
+    """Prometheus scrape endpoint, served next to /sse"""
+    start_prefetch()
+    return PlainTextResponse(metrics.render(metrics_gauges(), metrics_counters()), media_type="text/plain; version=0.0.4")
+
+
+class ChartResourceTemplate(ResourceTemplate):
+    """chart://{digest} template whose resources carry each chart's stored media type
+
+    FastMCP otherwise gives every resource read through a template the
+    template's fixed mime type.
+    """
+
+    async def create_resource(self, uri, params, context=None):
+        content, media_type = await self.fn(**params)
+        return FunctionResource(uri=uri, name=self.name, description=self.description,
+                                mime_type=media_type, fn=lambda: content)
+
+
+async def chart_resource(digest: str):
+    """Chart rendered by get_chart or get_natal_report, addressed by the SHA-256 of its content"""
+    stored = await asyncio.to_thread(get_chart_store().read, digest)
+    if stored is None:
+        raise ValueError(f"Unknown chart: {digest}")
+    content, media_type = stored
+    return (content.decode() if "svg" in media_type else content), media_type
+
+
+mcp._resource_manager._templates["chart://{digest}"] = ChartResourceTemplate.from_function(
+    chart_resource, "chart://{digest}", mime_type="image/svg+xml"
+)
 
 
 @mcp.tool()
-def get_panchang(coordinates: str, datetime_str: str) -> str:
-    """Get panchang details including tithi, nakshatra, yoga, karana, and other astrological details
+@instrument_tool
+async def find_place(query: str, limit: int = 5) -> str:
+    """Look up a place offline and get the coordinates and timezone to pass to other tools
     Args:
-        coordinates: Latitude,Longitude (e.g., "8.8932,76.6141")
-        datetime_str: Date and time in 24 hours format with timezone  in YYYY-MM-DDTHH:MM:SS+05:30
+        query: Place name, optionally with state or country (e.g., "Kollam, Kerala", "Cochin, KL", "Hyderabad, Pakistan")
+        limit: Maximum number of matches, best first
     """
     try:
-        formatted_datetime = format_datetime(datetime_str)
-        headers = get_auth_headers()
-        params = {
-            "ayanamsa": 1,
-            "coordinates": coordinates,
-            "datetime": formatted_datetime
-        }
-        
-        print_api_info("Panchang Request", {
-            "url": "https://api.prokerala.com/v2/astrology/panchang",
-            "headers": headers,
-            "params": params
-        })
-        
-        response = requests.get(
-            "https://api.prokerala.com/v2/astrology/panchang",
-            headers=headers,
-            params=params
-        )
-        
-        print_api_info("Panchang Response", {
-            "status_code": response.status_code,
-            "headers": dict(response.headers),
-            "response": response.json() if response.status_code == 200 else response.text
-        })
-        
-        if response.status_code != 200:
-            return f"API Error: {response.status_code} - {response.text}"
-            
-        return json.dumps(response.json(), indent=2, ensure_ascii=False)
+        if not places.loaded:
+            # The first lookup may build the index
+            await asyncio.to_thread(places.load)
+        matches = places.search(query, limit=max(1, limit))
+        for match in matches:
+            match["coordinates"] = canonical_coordinates(f"{match['latitude']},{match['longitude']}")
+            match["utc_offset"] = gazetteer.utc_offset(match["timezone"])
+        return compact_json({"query": query, "matches": matches})
     except Exception as e:
-        logger.error(f"Error getting panchang: {str(e)}", exc_info=True)
+        logger.error(f"Error looking up place: {str(e)}", exc_info=True)
         return f"Error: {str(e)}"
 
 @mcp.tool()
-def get_kundli(coordinates: str, datetime_str: str) -> str:
-    """Get kundli details for given coordinates and datetime"""
+@instrument_tool
+async def get_kundli(coordinates: str, datetime_str: str, fields: str = "") -> str:
+    """Get kundli details for given coordinates and datetime
+    Args:
+        fields: Optional comma-separated dotted paths under "data" to return instead of the full response (e.g. "nakshatra_details,mangal_dosha.has_dosha")
+    """
     try:
         logger.info(f"Getting kundli for coordinates: {coordinates}, datetime: {datetime_str}")
         
         formatted_datetime = format_datetime(datetime_str)
         logger.debug(f"Formatted datetime: {formatted_datetime}")
         
-        headers = get_auth_headers()
+        headers = await get_auth_headers()
         params = {
             "ayanamsa": 1,
             "coordinates": coordinates,
             "datetime": formatted_datetime
         }
         
-        print_api_info("Kundli Request", {
-            "url": "https://api.prokerala.com/v2/astrology/kundli/advanced",
-            "headers": headers,
-            "params": params
-        })
-        
-        response = make_api_request(
-            "https://api.prokerala.com/v2/astrology/kundli/advanced",
+        response = await make_api_request(
+            f"{API_BASE_URL}/v2/astrology/kundli/advanced",
             headers=headers,
             params=params
         )
         
-        print_api_info("Kundli Response", {
-            "status_code": response.status_code,
-            "headers": dict(response.headers),
-            "response": response.json() if response.status_code == 200 else response.text
-        })
-        
         if response.status_code != 200:
             return f"API Error: {response.status_code} - {response.text}"
             
         response.raise_for_status()
         
-        result = response.json()
-        return json.dumps(result, indent=2, ensure_ascii=False)
+        return dump_response_json(response, ensure_ascii=False, fields=fields)
         
     except ValueError as e:
         logger.error(f"Validation error: {str(e)}")
         return f"Error: {str(e)}"
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPStatusError as e:
         logger.error(f"Request error: {str(e)}")
-        logger.error(f"Request URL: {e.request.url if hasattr(e, 'request') else 'Unknown'}")
-        logger.error(f"Response: {e.response.text if hasattr(e, 'response') else 'No response'}")
+        logger.error(f"Request URL: {e.request.url}")
+        logger.error(f"Response: {e.response.text}")
         return f"Error: {str(e)}"
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}", exc_info=True)
@@ -248,75 +1017,140 @@ def get_kundli(coordinates: str, datetime_str: str) -> str:
 
 # Calendar and Panchang Tools
 @mcp.tool()
-def get_calendar(coordinates: str, datetime: str) -> str:
-    """Get calendar details for given coordinates and datetime"""
+@instrument_tool
+async def get_calendar(coordinates: str, datetime: str, fields: str = "") -> str:
+    """Get calendar details for given coordinates and datetime
+    Args:
+        fields: Optional comma-separated dotted paths under "data" to return instead of the full response
+    """
     try:
-        headers = get_auth_headers()
+        headers = await get_auth_headers()
         params = {
             "ayanamsa": 1,
             "coordinates": coordinates,
             "datetime": datetime
         }
-        response = make_api_request(
-            "https://api.prokerala.com/v2/astrology/calendar",
+        response = await make_api_request(
+            f"{API_BASE_URL}/v2/astrology/calendar",
             headers=headers,
             params=params
         )
         response.raise_for_status()
-        return json.dumps(response.json(), indent=2)
+        return dump_response_json(response, fields=fields)
     except Exception as e:
         logger.error(f"Error getting calendar: {str(e)}")
         return f"Error: {str(e)}"
 
 @mcp.tool()
-def get_panchang(coordinates: str, datetime_str: str) -> str:
+@instrument_tool
+async def get_panchang(coordinates: str, datetime_str: str, fields: str = "") -> str:
     """Get panchang details including tithi, nakshatra, yoga, karana, and other astrological details
     Args:
         coordinates: Latitude,Longitude (e.g., "8.8932,76.6141")
         datetime_str: Date and time in 24 hours format with timezone  in YYYY-MM-DDTHH:MM:SS+05:30
+        fields: Optional comma-separated dotted paths under "data" to return instead of the full response
     """
     try:
         formatted_datetime = format_datetime(datetime_str)
-        headers = get_auth_headers()
+        local = await local_panchang(coordinates, [parse_datetime(formatted_datetime)])
+        if local is not None:
+            return derived_response_json(local[0], fields=fields)
+        headers = await get_auth_headers()
         params = {
             "ayanamsa": 1,
             "coordinates": coordinates,
             "datetime": formatted_datetime
         }
         
-        print_api_info("Panchang Request", {
-            "url": "https://api.prokerala.com/v2/astrology/panchang",
-            "headers": headers,
-            "params": params
-        })
-        
-        response = requests.get(
-            "https://api.prokerala.com/v2/astrology/panchang",
+        response = await make_api_request(
+            f"{API_BASE_URL}/v2/astrology/panchang",
             headers=headers,
             params=params
         )
         
-        print_api_info("Panchang Response", {
-            "status_code": response.status_code,
-            "headers": dict(response.headers),
-            "response": response.json() if response.status_code == 200 else response.text
-        })
-        
         if response.status_code != 200:
             return f"API Error: {response.status_code} - {response.text}"
             
-        return json.dumps(response.json(), indent=2, ensure_ascii=False)
+        return dump_response_json(response, ensure_ascii=False, fields=fields)
     except Exception as e:
         logger.error(f"Error getting panchang: {str(e)}", exc_info=True)
         return f"Error: {str(e)}"
 
+@mcp.tool()
+@instrument_tool
+async def get_panchang_range(coordinates: str, start: str, end: str, ctx: Context = None) -> str:
+    """Get panchang for every day in a date range in one call (e.g. a month for a calendar page)
+    Args:
+        coordinates: Latitude,Longitude (e.g., "8.8932,76.6141")
+        start: First day in YYYY-MM-DDTHH:MM:SS+05:30 or YYYY-MM-DD HH:MM AM/PM; only the date matters
+        end: Last day (inclusive), in the same format as start
+    """
+    try:
+        coordinates = canonical_coordinates(coordinates)
+        start_dt = parse_datetime(start)
+        end_dt = parse_datetime(end)
+        day_count = (end_dt.date() - start_dt.date()).days + 1
+        if day_count < 1:
+            raise ValueError("end must not be before start")
+        if day_count > PANCHANG_RANGE_MAX_DAYS:
+            raise ValueError(f"Date range too long: {day_count} days (maximum {PANCHANG_RANGE_MAX_DAYS})")
+
+        day_times = [start_dt + timedelta(days=i) for i in range(day_count)]
+        local = await local_panchang(coordinates, day_times)
+        if local is not None:
+            return compact_json({
+                "coordinates": coordinates,
+                "start": start_dt.date().isoformat(),
+                "end": end_dt.date().isoformat(),
+                "source": "local",
+                "days": [{"date": dt.date().isoformat(), **day} for dt, day in zip(day_times, local)],
+            })
+
+        headers = await get_auth_headers()
+
+        async def fetch_day(day_dt):
+            params = {
+                "ayanamsa": 1,
+                "coordinates": coordinates,
+                "datetime": day_dt.isoformat()
+            }
+            try:
+                response = await make_api_request(
+                    f"{API_BASE_URL}/v2/astrology/panchang",
+                    headers=headers,
+                    params=params,
+                    priority=BATCH
+                )
+                if response.status_code != 200:
+                    return {"date": day_dt.date().isoformat(), "error": f"API Error: {response.status_code} - {response.text}"}
+                payload = jsonout.loads(response.content)
+                day = {"date": day_dt.date().isoformat(), **payload.get("data", {})}
+                if payload.get("stale"):
+                    day["stale"] = True
+                return day
+            except Exception as e:
+                return {"date": day_dt.date().isoformat(), "error": str(e)}
+
+        days = await run_bounded(day_times, fetch_day, ctx=ctx)
+        return compact_json({
+            "coordinates": coordinates,
+            "start": start_dt.date().isoformat(),
+            "end": end_dt.date().isoformat(),
+            "days": days,
+        })
+    except Exception as e:
+        logger.error(f"Error getting panchang range: {str(e)}", exc_info=True)
+        return f"Error: {str(e)}"
+
 # Period Analysis Tools
 @mcp.tool()
-def get_auspicious_period(coordinates: str, datetime: str) -> str:
+@instrument_tool
+async def get_auspicious_period(coordinates: str, datetime: str, fields: str = "") -> str:
     """Get auspicious period details for given coordinates and datetime
     Args:
         coordinates: Latitude,Longitude (e.g., "23.1765,75.7885")
         datetime: Date and time in 24 hours format with timezone in YYYY-MM-DDTHH:MM:SS+05:30 (e.g., "2023-11-09T09:24:27+05:30")
+        fields: Optional comma-separated dotted paths under "data" to return instead of the full response
     
     Example API call:
     {
@@ -326,29 +1160,31 @@ def get_auspicious_period(coordinates: str, datetime: str) -> str:
     }
     """
     try:
-        headers = get_auth_headers()
+        headers = await get_auth_headers()
         params = {
             "ayanamsa": 1,
             "coordinates": coordinates,
             "datetime": datetime
         }
-        response = make_api_request(
-            "https://api.prokerala.com/v2/astrology/auspicious-period",
+        response = await make_api_request(
+            f"{API_BASE_URL}/v2/astrology/auspicious-period",
             headers=headers,
             params=params
         )
         response.raise_for_status()
-        return json.dumps(response.json(), indent=2)
+        return dump_response_json(response, fields=fields)
     except Exception as e:
         logger.error(f"Error getting auspicious period: {str(e)}")
         return f"Error: {str(e)}"
 
 @mcp.tool()
-def get_inauspicious_period(coordinates: str, datetime: str) -> str:
+@instrument_tool
+async def get_inauspicious_period(coordinates: str, datetime: str, fields: str = "") -> str:
     """Get inauspicious period details for given coordinates and datetime
     Args:
         coordinates: Latitude,Longitude (e.g., "23.1765,75.7885")
         datetime: Date and time in 24 hours format with timezone in YYYY-MM-DDTHH:MM:SS+05:30 (e.g., "2023-11-09T09:24:27+05:30")
+        fields: Optional comma-separated dotted paths under "data" to return instead of the full response
     
     Example API call:
     {
@@ -358,93 +1194,135 @@ def get_inauspicious_period(coordinates: str, datetime: str) -> str:
     }
     """
     try:
-        headers = get_auth_headers()
+        headers = await get_auth_headers()
         params = {
             "ayanamsa": 1,
             "coordinates": coordinates,
             "datetime": datetime
         }
-        response = make_api_request(
-            "https://api.prokerala.com/v2/astrology/inauspicious-period",
+        response = await make_api_request(
+            f"{API_BASE_URL}/v2/astrology/inauspicious-period",
             headers=headers,
             params=params
         )
         response.raise_for_status()
-        return json.dumps(response.json(), indent=2)
+        return dump_response_json(response, fields=fields)
     except Exception as e:
         logger.error(f"Error getting inauspicious period: {str(e)}")
         return f"Error: {str(e)}"
 
 # Horoscope and Birth Details
 @mcp.tool()
-def get_daily_horoscope(sign: str, datetime_str: str) -> str:
+@instrument_tool
+async def get_daily_horoscope(sign: str, datetime_str: str, fields: str = "") -> str:
     """Get daily horoscope for a zodiac sign
     Args:
         sign: Zodiac sign (e.g., aries, taurus, etc.)
         datetime_str: Date and time in 24 format with timezone, eg:  YYYY-MM-DDTHH:MM:SS+05:30,
+        fields: Optional comma-separated dotted paths under "data" to return instead of the full response
     """
     try:
         formatted_datetime = format_datetime(datetime_str)
-        headers = get_auth_headers()
+        headers = await get_auth_headers()
         params = {
             "datetime": formatted_datetime,
             "sign": sign.lower()
         }
         
-        print_api_info("Daily Horoscope Request", {
-            "url": "https://api.prokerala.com/v2/horoscope/daily",
-            "headers": headers,
-            "params": params
-        })
-        
-        response = requests.get(
-            "https://api.prokerala.com/v2/horoscope/daily",
+        response = await make_api_request(
+            f"{API_BASE_URL}/v2/horoscope/daily",
             headers=headers,
             params=params
         )
         
-        print_api_info("Daily Horoscope Response", {
-            "status_code": response.status_code,
-            "headers": dict(response.headers),
-            "response": response.json() if response.status_code == 200 else response.text
-        })
-        
         if response.status_code != 200:
             return f"API Error: {response.status_code} - {response.text}"
             
-        return json.dumps(response.json(), indent=2, ensure_ascii=False)
+        return dump_response_json(response, ensure_ascii=False, fields=fields)
     except Exception as e:
         logger.error(f"Error getting daily horoscope: {str(e)}", exc_info=True)
         return f"Error: {str(e)}"
 
 @mcp.tool()
-def get_birth_details(coordinates: str, datetime: str) -> str:
-    """Get birth details for given coordinates and datetime"""
+@instrument_tool
+async def get_daily_horoscopes(datetime_str: str, signs: list[str] | None = None, fields: str = "",
+                               ctx: Context = None) -> str:
+    """Get daily horoscopes for several zodiac signs in one call (all twelve by default)
+    Args:
+        datetime_str: Date in YYYY-MM-DDTHH:MM:SS+05:30 or YYYY-MM-DD HH:MM AM/PM; only the date matters
+        signs: Zodiac signs to include (e.g., ["aries", "leo"]); empty means all twelve
+        fields: Optional comma-separated dotted paths under each sign's "data" to return (e.g. "daily_prediction.prediction")
+    """
+    try:
+        formatted_datetime = canonical_date(datetime_str)
+        wanted = list(dict.fromkeys(sign.strip().lower() for sign in signs or ZODIAC_SIGNS))
+        unknown = [sign for sign in wanted if sign not in ZODIAC_SIGNS]
+        if unknown:
+            raise ValueError(f"Unknown zodiac sign(s): {', '.join(unknown)}")
+        headers = await get_auth_headers()
+
+        async def fetch_sign(sign):
+            try:
+                # Cached signs (e.g. prefetched ones) are answered without an upstream call
+                response = await make_api_request(
+                    f"{API_BASE_URL}/v2/horoscope/daily",
+                    headers=headers,
+                    params={"datetime": formatted_datetime, "sign": sign},
+                    priority=BATCH
+                )
+                if response.status_code != 200:
+                    return {"sign": sign, "error": f"API Error: {response.status_code} - {response.text}"}
+                payload = jsonout.loads(response.content)
+                horoscope = {"sign": sign, **jsonout.project(payload.get("data", {}), fields)}
+                if payload.get("stale"):
+                    horoscope["stale"] = True
+                return horoscope
+            except Exception as e:
+                return {"sign": sign, "error": str(e)}
+
+        horoscopes = await run_bounded(wanted, fetch_sign, ctx=ctx)
+        return compact_json({"date": formatted_datetime[:10], "horoscopes": horoscopes})
+    except Exception as e:
+        logger.error(f"Error getting daily horoscopes: {str(e)}", exc_info=True)
+        return f"Error: {str(e)}"
+
+@mcp.tool()
+@instrument_tool
+async def get_birth_details(coordinates: str, datetime: str, fields: str = "") -> str:
+    """Get birth details for given coordinates and datetime
+    Args:
+        fields: Optional comma-separated dotted paths under "data" to return instead of the full response
+    """
     try:
-        headers = get_auth_headers()
+        headers = await get_auth_headers()
         params = {
             "ayanamsa": 1,
             "coordinates": coordinates,
             "datetime": datetime
         }
-        response = make_api_request(
-            "https://api.prokerala.com/v2/astrology/birth-details",
+        response = await make_api_request(
+            f"{API_BASE_URL}/v2/astrology/birth-details",
             headers=headers,
             params=params
         )
         response.raise_for_status()
-        return json.dumps(response.json(), indent=2)
+        return dump_response_json(response, fields=fields)
     except Exception as e:
         logger.error(f"Error getting birth details: {str(e)}")
         return f"Error: {str(e)}"
 
 # Dosha Analysis Tools
 @mcp.tool()
-def get_kaal_sarp_dosha(coordinates: str, datetime: str) -> str:
+@instrument_tool
+async def get_kaal_sarp_dosha(coordinates: str, datetime: str, fields: str = "") -> str:
     """Get Kaal Sarp Dosha details for given coordinates and datetime
     Args:
         coordinates: Latitude,Longitude (e.g., "23.1765,75.7885")
         datetime: Date and time in 24 hours format with timezone in YYYY-MM-DDTHH:MM:SS+05:30 (e.g., "2023-11-09T09:24:27+05:30")
+        fields: Optional comma-separated dotted paths under "data" to return instead of the full response
+
+    With PROKERALA_LOCAL_DOSHA=1, answered locally ("source": "local") when a
+    kundli or planet positions for the same birth are already cached.
     
     Example:
     {
@@ -454,47 +1332,61 @@ def get_kaal_sarp_dosha(coordinates: str, datetime: str) -> str:
     }
     """
     try:
-        headers = get_auth_headers()
         params = {
             "ayanamsa": 1,
             "coordinates": coordinates,
             "datetime": datetime
         }
-        response = make_api_request(
-            "https://api.prokerala.com/v2/astrology/kaal-sarp-dosha",
+        derived = await local_dosha("kaal_sarp_dosha", f"{API_BASE_URL}/v2/astrology/kaal-sarp-dosha", params)
+        if derived is not None:
+            return derived_response_json(derived, fields=fields)
+        headers = await get_auth_headers()
+        response = await make_api_request(
+            f"{API_BASE_URL}/v2/astrology/kaal-sarp-dosha",
             headers=headers,
             params=params
         )
         response.raise_for_status()
-        return json.dumps(response.json(), indent=2)
+        return dump_response_json(response, fields=fields)
     except Exception as e:
         logger.error(f"Error getting Kaal Sarp Dosha: {str(e)}")
         return f"Error: {str(e)}"
 
 @mcp.tool()
-def get_manglik_dosha(coordinates: str, datetime: str) -> str:
-    """Get Manglik Dosha details for given coordinates and datetime"""
+@instrument_tool
+async def get_manglik_dosha(coordinates: str, datetime: str, fields: str = "") -> str:
+    """Get Manglik Dosha details for given coordinates and datetime
+    Args:
+        fields: Optional comma-separated dotted paths under "data" to return instead of the full response
+
+    With PROKERALA_LOCAL_DOSHA=1, answered locally ("source": "local") when a
+    kundli or planet positions for the same birth are already cached.
+    """
     try:
-        headers = get_auth_headers()
         params = {
             "ayanamsa": 1,
             "coordinates": coordinates,
             "datetime": datetime
         }
-        response = make_api_request(
-            "https://api.prokerala.com/v2/astrology/manglik-dosha",
+        derived = await local_dosha("manglik_dosha", f"{API_BASE_URL}/v2/astrology/manglik-dosha", params)
+        if derived is not None:
+            return derived_response_json(derived, fields=fields)
+        headers = await get_auth_headers()
+        response = await make_api_request(
+            f"{API_BASE_URL}/v2/astrology/manglik-dosha",
             headers=headers,
             params=params
         )
         response.raise_for_status()
-        return json.dumps(response.json(), indent=2)
+        return dump_response_json(response, fields=fields)
     except Exception as e:
         logger.error(f"Error getting Manglik Dosha: {str(e)}")
         return f"Error: {str(e)}"
 
 # Chart and Position Tools
 @mcp.tool()
-def get_chart(coordinates: str, datetime: str, chart_type: str = "rasi", chart_style: str = "south-indian", format: str = "svg", language: str = "en") -> str:
+@instrument_tool
+async def get_chart(coordinates: str, datetime: str, chart_type: str = "rasi", chart_style: str = "south-indian", format: str = "svg", language: str = "en", fields: str = "", inline: bool = True) -> str:
     """Get chart details for given coordinates and datetime
     Args:
         coordinates: Latitude,Longitude (e.g., "8.8932,76.6141")
@@ -503,6 +1395,11 @@ def get_chart(coordinates: str, datetime: str, chart_type: str = "rasi", chart_s
         chart_style: Style of chart (e.g., "south-indian")
         format: Output format (e.g., "svg")
         language: Language code (e.g., "en" for English, "ml" for Malayalam)
+        fields: Optional comma-separated dotted paths under "data" to return instead of the full response
+        inline: Include the SVG itself; otherwise only its chart:// resource URI is returned
+
+    Rendered charts are returned as {"uri": "chart://<digest>", "mime_type": ..., "svg": ...}
+    and can be read again later through the chart:// resource.
     
     Example:
     {
@@ -516,7 +1413,6 @@ def get_chart(coordinates: str, datetime: str, chart_type: str = "rasi", chart_s
     }
     """
     try:
-        headers = get_auth_headers()
         params = {
             "ayanamsa": 1,
             "coordinates": coordinates,
@@ -526,39 +1422,44 @@ def get_chart(coordinates: str, datetime: str, chart_type: str = "rasi", chart_s
             "format": format,
             "la": language
         }
-        response = make_api_request(
-            "https://api.prokerala.com/v2/astrology/chart",
-            headers=headers,
-            params=params
-        )
-        response.raise_for_status()
+        chart = await stored_chart(params)
+        if chart is None:
+            headers = await get_auth_headers()
+            response = await make_api_request(
+                f"{API_BASE_URL}/v2/astrology/chart",
+                headers=headers,
+                params=params
+            )
+            response.raise_for_status()
 
-        # Check the content type of the response
-        content_type = response.headers.get('Content-Type', '')
-
-        if 'svg' in content_type:
-            # Handle SVG content
-            svg_file_path = 'output.svg'
-            svg_data = response.text
-            with open(svg_file_path, 'w') as file:
-                file.write(svg_data)
-            return f"SVG chart saved to {svg_file_path}"
-        elif 'json' in content_type:
-            # Handle JSON content
-            return json.dumps(response.json(), indent=2)
-        else:
-            return f"Unsupported response format: {content_type}"
+            # Check the content type of the response
+            content_type = response.headers.get('Content-Type', '')
+
+            if 'json' in content_type:
+                # Handle JSON content
+                return dump_response_json(response, fields=fields)
+            elif not ('svg' in content_type or content_type.startswith('image/')):
+                return f"Unsupported response format: {content_type}"
+            chart = (await store_chart(params, response), response.content, content_type.split(";")[0])
+
+        uri, content, media_type = chart
+        result = {"uri": uri, "mime_type": media_type, "bytes": len(content)}
+        if inline and "svg" in media_type:
+            result["svg"] = content.decode()
+        return compact_json(result)
     except Exception as e:
         logger.error(f"Error getting chart: {str(e)}")
         return f"Error: {str(e)}"
 
 @mcp.tool()
-def get_planet_positions(coordinates: str, datetime: str, language: str = "en") -> str:
+@instrument_tool
+async def get_planet_positions(coordinates: str, datetime: str, language: str = "en", fields: str = "") -> str:
     """Get planet positions for given coordinates and datetime
     Args:
         coordinates: Latitude,Longitude (e.g., "8.8932,76.6141")
         datetime: Date and time in 24 hours format with timezone in YYYY-MM-DDTHH:MM:SS+05:30 (e.g., "1983-03-21T23:30:00+05:30")
         language: Language code (e.g., "en" for English, "ml" for Malayalam)
+        fields: Optional comma-separated dotted paths under "data" to return instead of the full response
     
     Example:
     {
@@ -569,33 +1470,152 @@ def get_planet_positions(coordinates: str, datetime: str, language: str = "en")
     }
     """
     try:
-        headers = get_auth_headers()
+        if language == "en":
+            local = local_planet_positions(coordinates, datetime)
+            if local is not None:
+                return derived_response_json(local, fields=fields)
+        headers = await get_auth_headers()
         params = {
             "ayanamsa": 1,
             "coordinates": coordinates,
             "datetime": datetime,
             "la": language
         }
-        response = make_api_request(
-            "https://api.prokerala.com/v2/astrology/planet-position",
+        response = await make_api_request(
+            f"{API_BASE_URL}/v2/astrology/planet-position",
             headers=headers,
             params=params
         )
         response.raise_for_status()
-        return json.dumps(response.json(), indent=2)
+        return dump_response_json(response, fields=fields)
     except Exception as e:
         logger.error(f"Error getting planet positions: {str(e)}")
         return f"Error: {str(e)}"
 
+# Endpoints gathered by get_natal_report, in merge order
+NATAL_REPORT_SECTIONS = [
+    ("birth_details", f"{API_BASE_URL}/v2/astrology/birth-details", {}),
+    ("kundli", f"{API_BASE_URL}/v2/astrology/kundli/advanced", {}),
+    ("planet_positions", f"{API_BASE_URL}/v2/astrology/planet-position", {"la": None}),
+    ("mangal_dosha", f"{API_BASE_URL}/v2/astrology/mangal-dosha", {"la": None}),
+    ("kaal_sarp_dosha", f"{API_BASE_URL}/v2/astrology/kaal-sarp-dosha", {}),
+]
+
+def dedupe_sections(sections):
+    """Replace objects already present in an earlier section with {"$ref": "<path>"}"""
+    seen = {}
+
+    def walk(value, path):
+        if isinstance(value, (dict, list)) and value:
+            fingerprint = jsonout.fingerprint(value)
+            if fingerprint in seen:
+                return {"$ref": seen[fingerprint]}
+            seen[fingerprint] = path
+        if isinstance(value, dict):
+            return {k: walk(v, f"{path}.{k}") for k, v in value.items()}
+        return value
+
+    return {name: walk(data, name) for name, data in sections.items()}
+
+@mcp.tool()
+@instrument_tool
+async def get_natal_report(coordinates: str, datetime: str, language: str = "en",
+                           include_chart: bool = True, chart_style: str = "south-indian", fields: str = "") -> str:
+    """Get a full natal report in one call: birth details, kundli, planet positions, mangal dosha, kaal sarp dosha and rasi chart
+    Args:
+        coordinates: Latitude,Longitude (e.g., "8.8932,76.6141")
+        datetime: Date and time of birth in YYYY-MM-DDTHH:MM:SS+05:30 (e.g., "1983-03-21T23:30:00+05:30")
+        language: Language code (e.g., "en" for English, "ml" for Malayalam)
+        include_chart: Include the rasi chart SVG and its chart:// resource URI
+        chart_style: Style of chart (e.g., "south-indian")
+        fields: Optional comma-separated dotted paths to return instead of the full report (e.g. "kundli.mangal_dosha,planet_positions.planet_position.name")
+
+    Repeated sub-objects are included once; later copies are replaced by {"$ref": "<section.path>"}.
+    Only the sections named in fields are fetched.
+    """
+    try:
+        base_params = {
+            "ayanamsa": 1,
+            "coordinates": canonical_coordinates(coordinates),
+            "datetime": canonical_datetime(datetime)
+        }
+        headers = await get_auth_headers()
+
+        sections = list(NATAL_REPORT_SECTIONS)
+        if include_chart:
+            sections.append(("chart", f"{API_BASE_URL}/v2/astrology/chart",
+                             {"chart_type": "rasi", "chart_style": chart_style, "format": "svg", "la": None}))
+        wanted = {path[0] for path in jsonout.parse_fields(fields)}
+        if wanted:
+            # Don't fetch sections the caller projected away
+            sections = [section for section in sections if section[0] in wanted]
+
+        async def fetch_section(section):
+            name, url, extra = section
+            params = {**base_params, **{k: (language if v is None else v) for k, v in extra.items()}}
+            try:
+                if name in dosha.DERIVATIONS:
+                    derived = await local_dosha(name, url, params)
+                    if derived is not None:
+                        return name, derived, None
+                if name == "planet_positions" and language == "en":
+                    local = local_planet_positions(params["coordinates"], params["datetime"])
+                    if local is not None:
+                        return name, local, None
+                if name == "chart":
+                    chart = await stored_chart(params)
+                    if chart is not None:
+                        return name, {"uri": chart[0], "svg": chart[1].decode()}, None
+                response = await make_api_request(url, headers=headers, params=params)
+                if response.status_code != 200:
+                    return name, None, f"API Error: {response.status_code} - {response.text}"
+                if "svg" in response.headers.get("Content-Type", ""):
+                    return name, {"uri": await store_chart(params, response), "svg": response.text}, None
+                return name, jsonout.loads(response.content).get("data", {}), None
+            except Exception as e:
+                return name, None, str(e)
+
+        # Doshas go last so they can be derived from this report's kundli and planet positions
+        derivable = [section for section in sections if LOCAL_DOSHA and section[0] in dosha.DERIVATIONS]
+        results = await run_bounded([s for s in sections if s not in derivable], fetch_section, limit=len(sections))
+        fetched = {name: data for name, data, error in results if error is None}
+        pending = []
+        for section in derivable:
+            name, url, extra = section
+            derived = None
+            if "la" not in extra or language == "en":
+                derived = dosha.derive(name, fetched.get("kundli"), fetched.get("planet_positions"))
+            if derived is None:
+                pending.append(section)
+            else:
+                metrics.inc("prokerala_dosha_derived_total", {"dosha": name})
+                results.append((name, derived, None))
+        results += await run_bounded(pending, fetch_section, limit=len(sections))
+        order = [section[0] for section in sections]
+        results.sort(key=lambda result: order.index(result[0]))
+
+        report = {name: data for name, data, error in results if error is None}
+        errors = {name: error for name, data, error in results if error is not None}
+
+        document = {**base_params, **dedupe_sections(jsonout.project(report, fields))}
+        if errors:
+            document["errors"] = errors
+        return compact_json(document)
+    except Exception as e:
+        logger.error(f"Error getting natal report: {str(e)}", exc_info=True)
+        return f"Error: {str(e)}"
+
 # Matching Tools
 @mcp.tool()
-def get_kundli_matching(girl_coordinates: str, girl_dob: str, boy_coordinates: str, boy_dob: str) -> str:
+@instrument_tool
+async def get_kundli_matching(girl_coordinates: str, girl_dob: str, boy_coordinates: str, boy_dob: str, fields: str = "") -> str:
     """Get kundli matching details for given coordinates and dates of birth
     Args:
         girl_coordinates: Girl's birth coordinates (Latitude,Longitude) (e.g., "23.1765,75.7885")
         girl_dob: Girl's date of birth in 24 hours format with timezone in YYYY-MM-DDTHH:MM:SS+05:30 (e.g., "2023-11-09T09:24:27+05:30")
         boy_coordinates: Boy's birth coordinates (Latitude,Longitude) (e.g., "23.1765,75.7885")
         boy_dob: Boy's date of birth in 24 hours format with timezone in YYYY-MM-DDTHH:MM:SS+05:30 (e.g., "2023-11-09T09:24:27+05:30")
+        fields: Optional comma-separated dotted paths under "data" to return instead of the full response
     
     Example:
     {
@@ -607,7 +1627,7 @@ def get_kundli_matching(girl_coordinates: str, girl_dob: str, boy_coordinates: s
     }
     """
     try:
-        headers = get_auth_headers()
+        headers = await get_auth_headers()
         params = {
             "ayanamsa": 1,
             "girl_coordinates": girl_coordinates,
@@ -615,21 +1635,22 @@ def get_kundli_matching(girl_coordinates: str, girl_dob: str, boy_coordinates: s
             "boy_coordinates": boy_coordinates,
             "boy_dob": boy_dob
         }
-        response = make_api_request(
-            "https://api.prokerala.com/v2/astrology/kundli-matching/advanced",
+        response = await make_api_request(
+            f"{API_BASE_URL}/v2/astrology/kundli-matching/advanced",
             headers=headers,
             params=params
         )
         response.raise_for_status()
-        return json.dumps(response.json(), indent=2)
+        return dump_response_json(response, fields=fields)
     except Exception as e:
         logger.error(f"Error getting kundli matching: {str(e)}")
         return f"Error: {str(e)}"
 
 @mcp.tool()
-def get_porutham(girl_coordinates: str, girl_dob: str, 
+@instrument_tool
+async def get_porutham(girl_coordinates: str, girl_dob: str, 
                 boy_coordinates: str, boy_dob: str, 
-                system: str = "kerala", language: str = "ml") -> str:
+                system: str = "kerala", language: str = "ml", fields: str = "") -> str:
     """Get porutham (compatibility) details between two individuals
     Args:
         girl_coordinates: Girl's birth coordinates (Latitude,Longitude) (e.g., "23.1765,75.7885")
@@ -638,6 +1659,7 @@ def get_porutham(girl_coordinates: str, girl_dob: str,
         boy_dob: Boy's date of birth in 24 hours format with timezone in YYYY-MM-DDTHH:MM:SS+05:30 (e.g., "2023-11-09T09:24:27+05:30")
         system: Matching system (e.g., "kerala")
         language: Language code (e.g., "ml" for Malayalam, "en" for English)
+        fields: Optional comma-separated dotted paths under "data" to return instead of the full response
     
     Example:
     {
@@ -651,7 +1673,7 @@ def get_porutham(girl_coordinates: str, girl_dob: str,
     }
     """
     try:
-        headers = get_auth_headers()
+        headers = await get_auth_headers()
         params = {
             "ayanamsa": 1,
             "girl_coordinates": girl_coordinates,
@@ -662,36 +1684,25 @@ def get_porutham(girl_coordinates: str, girl_dob: str,
             "lang": language
         }
         
-        print_api_info("Porutham Request", {
-            "url": "https://api.prokerala.com/v2/astrology/porutham/advanced",
-            "headers": headers,
-            "params": params
-        })
-        
-        response = requests.get(
-            "https://api.prokerala.com/v2/astrology/porutham/advanced",
+        response = await make_api_request(
+            f"{API_BASE_URL}/v2/astrology/porutham/advanced",
             headers=headers,
             params=params
         )
         
-        print_api_info("Porutham Response", {
-            "status_code": response.status_code,
-            "headers": dict(response.headers),
-            "response": response.json() if response.status_code == 200 else response.text
-        })
-        
         if response.status_code != 200:
             return f"API Error: {response.status_code} - {response.text}"
             
-        return json.dumps(response.json(), indent=2, ensure_ascii=False)
+        return dump_response_json(response, ensure_ascii=False, fields=fields)
     except Exception as e:
         logger.error(f"Error getting porutham: {str(e)}", exc_info=True)
         return f"Error: {str(e)}"
 
 @mcp.tool()
-def get_papasamyam(girl_coordinates: str, girl_dob: str, 
+@instrument_tool
+async def get_papasamyam(girl_coordinates: str, girl_dob: str, 
                   boy_coordinates: str, boy_dob: str, 
-                  system: str = "kerala", language: str = "ml") -> str:
+                  system: str = "kerala", language: str = "ml", fields: str = "") -> str:
     """Check for papasamyam (dosha compatibility) between two individuals
     Args:
         girl_coordinates: Girl's birth coordinates (Latitude,Longitude) (e.g., "23.1765,75.7885")
@@ -700,6 +1711,7 @@ def get_papasamyam(girl_coordinates: str, girl_dob: str,
         boy_dob: Boy's date of birth in 24 hours format with timezone in YYYY-MM-DDTHH:MM:SS+05:30 (e.g., "2023-11-09T09:24:27+05:30")
         system: Matching system (e.g., "kerala")
         language: Language code (e.g., "ml" for Malayalam, "en" for English)
+        fields: Optional comma-separated dotted paths under "data" to return instead of the full response
     
     Example:
     {
@@ -716,7 +1728,7 @@ def get_papasamyam(girl_coordinates: str, girl_dob: str,
         girl_formatted_dob = format_datetime(girl_dob)
         boy_formatted_dob = format_datetime(boy_dob)
         
-        headers = get_auth_headers()
+        headers = await get_auth_headers()
         params = {
             "ayanamsa": 1,
             "girl_coordinates": girl_coordinates,
@@ -727,39 +1739,120 @@ def get_papasamyam(girl_coordinates: str, girl_dob: str,
             "lang": language
         }
         
-        print_api_info("Papasamyam Request", {
-            "url": "https://api.prokerala.com/v2/astrology/papasamyam-check",
-            "headers": headers,
-            "params": params
-        })
-        
-        response = requests.get(
-            "https://api.prokerala.com/v2/astrology/papasamyam-check",
+        response = await make_api_request(
+            f"{API_BASE_URL}/v2/astrology/papasamyam-check",
             headers=headers,
             params=params
         )
         
-        print_api_info("Papasamyam Response", {
-            "status_code": response.status_code,
-            "headers": dict(response.headers),
-            "response": response.json() if response.status_code == 200 else response.text
-        })
-        
         if response.status_code != 200:
             return f"API Error: {response.status_code} - {response.text}"
             
-        return json.dumps(response.json(), indent=2, ensure_ascii=False)
+        return dump_response_json(response, ensure_ascii=False, fields=fields)
     except Exception as e:
         logger.error(f"Error getting papasamyam: {str(e)}", exc_info=True)
         return f"Error: {str(e)}"
 
+def match_score(data):
+    """Pull (points, maximum points) out of a kundli-matching or porutham response"""
+    source = data.get("guna_milan", data)
+    points = source.get("total_points")
+    maximum = source.get("maximum_points")
+    return (float(points) if points is not None else None,
+            float(maximum) if maximum is not None else None)
+
 @mcp.tool()
-def get_mangal_dosha(coordinates: str, datetime: str, language: str = "ml") -> str:
+@instrument_tool
+async def get_batch_matching(profile_coordinates: str, profile_dob: str, candidates: list[dict],
+                             profile_role: str = "girl", system: str = "ashtakoot",
+                             language: str = "en", include_details: bool = False,
+                             ctx: Context = None) -> str:
+    """Match one profile against many candidates and rank them by score
+    Args:
+        profile_coordinates: Profile's birth coordinates (Latitude,Longitude) (e.g., "23.1765,75.7885")
+        profile_dob: Profile's date of birth in YYYY-MM-DDTHH:MM:SS+05:30 (e.g., "2023-11-09T09:24:27+05:30")
+        candidates: List of {"name": optional label, "coordinates": "Latitude,Longitude", "dob": "YYYY-MM-DDTHH:MM:SS+05:30"}
+        profile_role: "girl" or "boy"; candidates take the other role
+        system: "ashtakoot" (guna milan via kundli matching), or a porutham system such as "kerala" or "tamil"
+        language: Language code for porutham results (e.g., "ml" for Malayalam, "en" for English)
+        include_details: Include the full upstream match result for every candidate
+    """
+    try:
+        profile_role = profile_role.lower()
+        if profile_role not in ("girl", "boy"):
+            raise ValueError("profile_role must be 'girl' or 'boy'")
+        if not candidates:
+            raise ValueError("candidates must not be empty")
+        if len(candidates) > MATCH_MAX_CANDIDATES:
+            raise ValueError(f"Too many candidates: {len(candidates)} (maximum {MATCH_MAX_CANDIDATES})")
+        candidate_role = "boy" if profile_role == "girl" else "girl"
+        profile_coordinates = canonical_coordinates(profile_coordinates)
+        profile_dob = canonical_datetime(profile_dob)
+
+        if system.lower() == "ashtakoot":
+            url = f"{API_BASE_URL}/v2/astrology/kundli-matching/advanced"
+            extra_params = {}
+        else:
+            url = f"{API_BASE_URL}/v2/astrology/porutham/advanced"
+            extra_params = {"system": system.lower(), "lang": language}
+
+        headers = await get_auth_headers()
+
+        async def match_candidate(indexed):
+            index, candidate = indexed
+            result = {"index": index, "name": candidate.get("name", str(index))}
+            try:
+                params = {
+                    "ayanamsa": 1,
+                    f"{profile_role}_coordinates": profile_coordinates,
+                    f"{profile_role}_dob": profile_dob,
+                    f"{candidate_role}_coordinates": candidate["coordinates"],
+                    f"{candidate_role}_dob": candidate["dob"],
+                    **extra_params
+                }
+                response = await make_api_request(url, headers=headers, params=params, priority=BATCH)
+                if response.status_code != 200:
+                    result["error"] = f"API Error: {response.status_code} - {response.text}"
+                    return result
+                data = jsonout.loads(response.content).get("data", {})
+                result["score"], result["maximum_score"] = match_score(data)
+                message = data.get("message")
+                if isinstance(message, dict):
+                    result["message"] = message.get("description")
+                if include_details:
+                    result["details"] = data
+            except KeyError as e:
+                result["error"] = f"Candidate is missing {e}"
+            except Exception as e:
+                result["error"] = str(e)
+            return result
+
+        results = await run_bounded(list(enumerate(candidates)), match_candidate, ctx=ctx)
+        matched = [r for r in results if r.get("score") is not None]
+        failed = [r for r in results if r.get("score") is None]
+        matched.sort(key=lambda r: r["score"], reverse=True)
+        return compact_json({
+            "profile": {"role": profile_role, "coordinates": profile_coordinates, "dob": profile_dob},
+            "system": system.lower(),
+            "ranked": matched,
+            "failed": failed,
+        })
+    except Exception as e:
+        logger.error(f"Error running batch matching: {str(e)}", exc_info=True)
+        return f"Error: {str(e)}"
+
+@mcp.tool()
+@instrument_tool
+async def get_mangal_dosha(coordinates: str, datetime: str, language: str = "ml", fields: str = "") -> str:
     """Get Mangal Dosha details for given coordinates and datetime
     Args:
         coordinates: Latitude,Longitude (e.g., "23.1765,75.7885")
         datetime: Date and time in 24 hours format with timezone in YYYY-MM-DDTHH:MM:SS+05:30 (e.g., "2023-11-09T09:24:27+05:30")
         language: Language code (e.g., "ml" for Malayalam, "en" for English)
+        fields: Optional comma-separated dotted paths under "data" to return instead of the full response
+
+    With PROKERALA_LOCAL_DOSHA=1, English requests are answered locally ("source": "local")
+    when a kundli or planet positions for the same birth are already cached.
     
     Example:
     {
@@ -770,25 +1863,30 @@ def get_mangal_dosha(coordinates: str, datetime: str, language: str = "ml") -> s
     }
     """
     try:
-        headers = get_auth_headers()
         params = {
             "ayanamsa": 1,
             "coordinates": coordinates,
             "datetime": datetime,
             "la": language
         }
-        response = make_api_request(
-            "https://api.prokerala.com/v2/astrology/mangal-dosha",
+        derived = await local_dosha("mangal_dosha", f"{API_BASE_URL}/v2/astrology/mangal-dosha", params)
+        if derived is not None:
+            return derived_response_json(derived, fields=fields)
+        headers = await get_auth_headers()
+        response = await make_api_request(
+            f"{API_BASE_URL}/v2/astrology/mangal-dosha",
             headers=headers,
             params=params
         )
         response.raise_for_status()
-        return json.dumps(response.json(), indent=2)
+        return dump_response_json(response, fields=fields)
     except Exception as e:
         logger.error(f"Error getting Mangal Dosha: {str(e)}")
         return f"Error: {str(e)}"
 
 if __name__ == "__main__":
+    # Not every FastMCP release picks FASTMCP_PORT up from the environment
+    mcp.settings.port = int(os.getenv("FASTMCP_PORT", mcp.settings.port))
     mcp.run(transport="sse")
 
 # run using  fastmcp run coremcp.py:mcp --transport sse 
\ No newline at end of file
@@ -0,0 +1,79 @@
+# Prokerala planet ids, used when names are localized
+PLANET_IDS = {"Sun": 0, "Moon": 1, "Mercury": 2, "Venus": 3, "Mars": 4, "Jupiter": 5, "Saturn": 6,
+              "Ascendant": 100, "Rahu": 101, "Ketu": 102}
+
+# Houses from the ascendant (or Moon) in which Mars causes Mangal dosha
+MANGAL_HOUSES = (1, 2, 4, 7, 8, 12)
+
+# Kaal sarp dosha type by the house Rahu occupies
+KAAL_SARP_TYPES = {1: "Anant", 2: "Kulik", 3: "Vasuki", 4: "Shankhpal", 5: "Padma", 6: "Mahapadma",
+                   7: "Takshak", 8: "Karkotak", 9: "Shankhachood", 10: "Ghatak", 11: "Vishdhar", 12: "Sheshnag"}
+
+
+def longitudes(planet_position):
+    """Map English planet name -> sidereal longitude from a planet-position "planet_position" list"""
+    by_id = {pid: name for name, pid in PLANET_IDS.items()}
+    found = {}
+    for planet in planet_position:
+        name = planet.get("name") if planet.get("name") in PLANET_IDS else by_id.get(planet.get("id"))
+        if name is not None:
+            found[name] = float(planet["longitude"])
+    missing = [name for name in PLANET_IDS if name not in found]
+    if missing:
+        raise KeyError(f"planet positions are missing {', '.join(missing)}")
+    return found
+
+
+def house_from(longitude, reference):
+    """Whole-sign house (1-12) of a longitude counted from the sign of reference"""
+    return (int(longitude // 30) - int(reference // 30)) % 12 + 1
+
+
+def mangal_dosha(positions):
+    """Mars in house 1, 2, 4, 7, 8 or 12 from the ascendant or the Moon"""
+    from_lagna = house_from(positions["Mars"], positions["Ascendant"])
+    from_moon = house_from(positions["Mars"], positions["Moon"])
+    has_dosha = from_lagna in MANGAL_HOUSES or from_moon in MANGAL_HOUSES
+    verdict = "The person is Manglik" if has_dosha else "The person is not Manglik"
+    return {
+        "has_dosha": has_dosha,
+        "description": f"{verdict}: Mars is in house {from_lagna} from the ascendant and house {from_moon} from the Moon.",
+    }
+
+
+def kaal_sarp_dosha(positions):
+    """All seven planets hemmed in on one side of the Rahu-Ketu axis"""
+    rahu = positions["Rahu"]
+    sides = {(positions[name] - rahu) % 360 < 180
+             for name in ("Sun", "Moon", "Mars", "Mercury", "Jupiter", "Venus", "Saturn")}
+    has_dosha = len(sides) == 1
+    dosha_type = KAAL_SARP_TYPES[house_from(rahu, positions["Ascendant"])] if has_dosha else None
+    if has_dosha:
+        description = f"All planets are between Rahu and Ketu, forming {dosha_type} Kaal Sarp Dosha."
+    else:
+        description = "Planets fall on both sides of the Rahu-Ketu axis, so there is no Kaal Sarp Dosha."
+    return {"has_dosha": has_dosha, "dosha_type": dosha_type, "description": description}
+
+
+DERIVATIONS = {
+    "mangal_dosha": mangal_dosha,
+    "manglik_dosha": mangal_dosha,
+    "kaal_sarp_dosha": kaal_sarp_dosha,
+}
+
+
+def derive(kind, kundli=None, planet_position=None):
+    """Derive a dosha check from kundli/advanced and/or planet-position "data", or return None
+
+    The kundli's own mangal_dosha section is used as is; everything else is
+    computed from planet longitudes with the common rules, covering the
+    has_dosha/description part of the Prokerala response.
+    """
+    if kind in ("mangal_dosha", "manglik_dosha") and kundli and isinstance(kundli.get("mangal_dosha"), dict):
+        return kundli["mangal_dosha"]
+    if not planet_position:
+        return None
+    try:
+        return DERIVATIONS[kind](longitudes(planet_position.get("planet_position", [])))
+    except (KeyError, TypeError, ValueError):
+        return None
@@ -0,0 +1,327 @@
+"""Local sidereal (Lahiri) planet positions, vectorized with NumPy
+
+A fast path for /v2/astrology/planet-position. Everything is evaluated on
+arrays, so thousands of timestamps cost about as much as one:
+
+    jd = julian_day([datetime(...), ...])
+    longitudes = sidereal_longitudes(jd, latitude, longitude)
+
+Models: Sun and planets from the JPL approximate Keplerian elements
+(valid 1800-2050), the Moon from the main terms of Meeus' lunar theory,
+Rahu/Ketu as the mean node, the ascendant from mean sidereal time. All
+longitudes are apparent, in the mean equinox of date, minus the mean
+Lahiri ayanamsa, which is what Swiss Ephemeris based services return in
+sidereal mode.
+
+Validate against recorded Prokerala responses (see replay.py) with
+
+    python ephemeris.py --validate fixtures.sqlite
+"""
+import argparse
+import json
+from datetime import datetime, timezone
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+AVAILABLE = np is not None
+
+# Target worst-case difference from Prokerala, in degrees of longitude. Checked in
+# tests/test_ephemeris.py against Swiss Ephemeris reference charts, not against
+# recorded Prokerala responses; run --validate on a recording before relying on
+# them. Rahu/Ketu assume Prokerala uses the mean node; against the true node the
+# gap can exceed 1 deg.
+TOLERANCES = {"Ascendant": 0.05, "Sun": 0.02, "Moon": 0.02, "Mercury": 0.02, "Venus": 0.02, "Mars": 0.05,
+              "Jupiter": 0.15, "Saturn": 0.2, "Rahu": 0.01, "Ketu": 0.01}
+
+# Prokerala planet ids and output order
+PLANET_IDS = {"Ascendant": 100, "Sun": 0, "Moon": 1, "Mercury": 2, "Venus": 3, "Mars": 4, "Jupiter": 5,
+              "Saturn": 6, "Rahu": 101, "Ketu": 102}
+RASIS = ["Mesha", "Vrishabha", "Mithuna", "Karka", "Simha", "Kanya",
+         "Tula", "Vrischika", "Dhanu", "Makara", "Kumbha", "Meena"]
+
+J2000 = 2451545.0
+
+# JPL approximate Keplerian elements, J2000 ecliptic and equinox (Standish, valid 1800-2050):
+# a (AU), e, I, L, longitude of perihelion, longitude of node (degrees) and their rates per century
+ELEMENTS = {
+    "Mercury": ((0.38709927, 0.20563593, 7.00497902, 252.25032350, 77.45779628, 48.33076593),
+                (0.00000037, 0.00001906, -0.00594749, 149472.67411175, 0.16047689, -0.12534081)),
+    "Venus": ((0.72333566, 0.00677672, 3.39467605, 181.97909950, 131.60246718, 76.67984255),
+              (0.00000390, -0.00004107, -0.00078890, 58517.81538729, 0.00268329, -0.27769418)),
+    "Earth": ((1.00000261, 0.01671123, -0.00001531, 100.46457166, 102.93768193, 0.0),
+              (0.00000562, -0.00004392, -0.01294668, 35999.37244981, 0.32327364, 0.0)),
+    "Mars": ((1.52371034, 0.09339410, 1.84969142, -4.55343205, -23.94362959, 49.55953891),
+             (0.00001847, 0.00007882, -0.00813131, 19140.30268499, 0.44441088, -0.29257343)),
+    "Jupiter": ((5.20288700, 0.04838624, 1.30439695, 34.39644051, 14.72847983, 100.47390909),
+                (-0.00011607, -0.00013253, -0.00183714, 3034.74612775, 0.21252668, 0.20469106)),
+    "Saturn": ((9.53667594, 0.05386179, 2.48599187, 49.95424423, 92.59887831, 113.66242448),
+               (-0.00125060, -0.00050991, 0.00193609, 1222.49362201, -0.41897216, -0.28867794)),
+}
+
+# Periodic terms for the Moon's longitude (Meeus, Astronomical Algorithms, table 47.A):
+# multiples of D, M, M', F and the coefficient in 1e-6 degrees
+MOON_TERMS = (
+    (0, 0, 1, 0, 6288774), (2, 0, -1, 0, 1274027), (2, 0, 0, 0, 658314), (0, 0, 2, 0, 213618),
+    (0, 1, 0, 0, -185116), (0, 0, 0, 2, -114332), (2, 0, -2, 0, 58793), (2, -1, -1, 0, 57066),
+    (2, 0, 1, 0, 53322), (2, -1, 0, 0, 45758), (0, 1, -1, 0, -40923), (1, 0, 0, 0, -34720),
+    (0, 1, 1, 0, -30383), (2, 0, 0, -2, 15327), (0, 0, 1, 2, -12528), (0, 0, 1, -2, 10980),
+    (4, 0, -1, 0, 10675), (0, 0, 3, 0, 10034), (4, 0, -2, 0, 8548), (2, 1, -1, 0, -7888),
+    (2, 1, 0, 0, -6766), (1, 0, -1, 0, -5163), (1, 1, 0, 0, 4987), (2, -1, 1, 0, 4036),
+    (2, 0, 2, 0, 3994), (4, 0, 0, 0, 3861), (2, 0, -3, 0, 3665), (0, 1, -2, 0, -2689),
+    (2, 0, -1, 2, -2602), (2, -1, -2, 0, 2390), (1, 0, 1, 0, -2348), (2, -2, 0, 0, 2236),
+    (0, 1, 2, 0, -2120), (0, 2, 0, 0, -2069), (2, -2, -1, 0, 2048), (2, 0, 1, -2, -1773),
+    (2, 0, 0, 2, -1595), (4, -1, -1, 0, 1215), (0, 0, 2, 2, -1110), (3, 0, -1, 0, -892),
+    (2, 1, 1, 0, -810), (4, -1, -2, 0, 759), (0, 2, -1, 0, -713), (2, 2, -1, 0, -700),
+    (2, 1, -2, 0, 691), (2, -1, 0, -2, 596), (4, 0, 1, 0, 549), (0, 0, 4, 0, 537),
+    (4, -1, 0, 0, 520), (1, 0, -2, 0, -487), (2, 1, 0, -2, -399), (0, 0, 2, -2, -381),
+    (1, 1, 1, 0, 351), (3, 0, -2, 0, -340), (4, 0, -3, 0, 330), (2, -1, 2, 0, 327),
+    (0, 2, 1, 0, -323), (1, 1, -1, 0, 299), (2, 0, 3, 0, 294),
+)
+
+# Lahiri: 23d15m00.658s on 1956-03-21 0h TT (mean value as used by Swiss Ephemeris)
+LAHIRI_EPOCH_JD = 2435553.5
+LAHIRI_AT_EPOCH = 23.250182778 - 0.004660222
+
+ABERRATION = 20.49552 / 3600          # constant of aberration, degrees
+LIGHT_DAYS_PER_AU = 0.0057755183
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("The local ephemeris needs numpy (pip install numpy)")
+
+
+def julian_day(datetimes):
+    """Julian day (UT) for one or more timezone-aware datetimes"""
+    _require_numpy()
+    if isinstance(datetimes, datetime):
+        datetimes = [datetimes]
+    seconds = np.array([dt.astimezone(timezone.utc).timestamp() for dt in datetimes], dtype=float)
+    return seconds / 86400.0 + 2440587.5
+
+
+def delta_t(jd_ut):
+    """TT - UT in seconds (Espenak and Meeus polynomials)"""
+    year = 2000.0 + (jd_ut - J2000) / 365.25
+    t = year - 2000.0
+    u = (year - 1820.0) / 100.0
+    return np.select(
+        [year < 1900, year < 1920, year < 1941, year < 1961, year < 1986, year < 2005, year < 2050, year < 2150],
+        [
+            -20 + 32 * u ** 2,
+            -2.79 + 1.494119 * (year - 1900) - 0.0598939 * (year - 1900) ** 2
+            + 0.0061966 * (year - 1900) ** 3 - 0.000197 * (year - 1900) ** 4,
+            21.20 + 0.84493 * (year - 1920) - 0.076100 * (year - 1920) ** 2 + 0.0020936 * (year - 1920) ** 3,
+            29.07 + 0.407 * (year - 1950) - (year - 1950) ** 2 / 233 + (year - 1950) ** 3 / 2547,
+            45.45 + 1.067 * (year - 1975) - (year - 1975) ** 2 / 260 - (year - 1975) ** 3 / 718,
+            63.86 + 0.3345 * t - 0.060374 * t ** 2 + 0.0017275 * t ** 3 + 0.000651814 * t ** 4
+            + 0.00002373599 * t ** 5,
+            62.92 + 0.32217 * t + 0.005589 * t ** 2,
+            -20 + 32 * u ** 2 - 0.5628 * (2150 - year),
+        ],
+        default=-20 + 32 * u ** 2,
+    )
+
+
+def general_precession(T):
+    """Accumulated precession in longitude since J2000, degrees"""
+    return (5029.0966 * T + 1.11113 * T ** 2 - 0.000006 * T ** 3) / 3600.0
+
+
+def lahiri_ayanamsa(T):
+    """Mean Lahiri ayanamsa in degrees for Julian centuries (TT) since J2000"""
+    epoch = (LAHIRI_EPOCH_JD - J2000) / 36525.0
+    return LAHIRI_AT_EPOCH + general_precession(T) - general_precession(epoch)
+
+
+def _heliocentric(name, T):
+    """Heliocentric ecliptic J2000 coordinates (AU) from Keplerian elements"""
+    base, rate = ELEMENTS[name]
+    a, e, inc, mean_long, peri, node = (b + r * T for b, r in zip(base, rate))
+    mean_anomaly = np.radians((mean_long - peri + 180.0) % 360.0 - 180.0)
+    E = mean_anomaly + e * np.sin(mean_anomaly)
+    for _ in range(6):
+        E = E - (E - e * np.sin(E) - mean_anomaly) / (1.0 - e * np.cos(E))
+    xp = a * (np.cos(E) - e)
+    yp = a * np.sqrt(1.0 - e * e) * np.sin(E)
+    w, O, i = np.radians(peri - node), np.radians(node), np.radians(inc)
+    cw, sw, cO, sO, ci, si = np.cos(w), np.sin(w), np.cos(O), np.sin(O), np.cos(i), np.sin(i)
+    x = (cw * cO - sw * sO * ci) * xp + (-sw * cO - cw * sO * ci) * yp
+    y = (cw * sO + sw * cO * ci) * xp + (-sw * sO + cw * cO * ci) * yp
+    z = (sw * si) * xp + (cw * si) * yp
+    return x, y, z
+
+
+def _geocentric_planet(name, T, earth, sun_longitude):
+    """Apparent geocentric longitude (J2000 ecliptic) with light time and aberration"""
+    ex, ey, ez = earth
+    x, y, z = _heliocentric(name, T)
+    distance = np.sqrt((x - ex) ** 2 + (y - ey) ** 2 + (z - ez) ** 2)
+    x, y, z = _heliocentric(name, T - distance * LIGHT_DAYS_PER_AU / 36525.0)
+    dx, dy, dz = x - ex, y - ey, z - ez
+    longitude = np.degrees(np.arctan2(dy, dx))
+    latitude = np.arctan2(dz, np.hypot(dx, dy))
+    longitude -= ABERRATION * np.cos(np.radians(sun_longitude - longitude)) / np.cos(latitude)
+    return longitude
+
+
+def _moon(T):
+    """Geocentric longitude of the Moon, mean equinox of date"""
+    L = 218.3164477 + 481267.88123421 * T - 0.0015786 * T ** 2 + T ** 3 / 538841 - T ** 4 / 65194000
+    D = np.radians(297.8501921 + 445267.1114034 * T - 0.0018819 * T ** 2 + T ** 3 / 545868 - T ** 4 / 113065000)
+    M = np.radians(357.5291092 + 35999.0502909 * T - 0.0001536 * T ** 2 + T ** 3 / 24490000)
+    Mp = np.radians(134.9633964 + 477198.8675055 * T + 0.0087414 * T ** 2 + T ** 3 / 69699 - T ** 4 / 14712000)
+    F = np.radians(93.2720950 + 483202.0175233 * T - 0.0036539 * T ** 2 - T ** 3 / 3526000 + T ** 4 / 863310000)
+    E = 1.0 - 0.002516 * T - 0.0000074 * T ** 2
+    terms = np.array(MOON_TERMS, dtype=float)
+    arguments = np.outer(D, terms[:, 0]) + np.outer(M, terms[:, 1]) + np.outer(Mp, terms[:, 2]) + np.outer(F, terms[:, 3])
+    eccentricity = E[:, None] ** np.abs(terms[:, 1])
+    total = (terms[:, 4] * eccentricity * np.sin(arguments)).sum(axis=1)
+    A1 = np.radians(119.75 + 131.849 * T)
+    A2 = np.radians(53.09 + 479264.290 * T)
+    total += 3958 * np.sin(A1) + 1962 * np.sin(np.radians(L) - F) + 318 * np.sin(A2)
+    return L + total / 1e6
+
+
+def _mean_node(T):
+    return 125.0445479 - 1934.1362891 * T + 0.0020754 * T ** 2 + T ** 3 / 467441 - T ** 4 / 60616000
+
+
+def julian_centuries(jd_ut):
+    """Julian centuries (TT) since J2000 for Julian days (UT)"""
+    return (jd_ut + delta_t(jd_ut) / 86400.0 - J2000) / 36525.0
+
+
+def mean_sidereal_time(jd_ut):
+    """Greenwich mean sidereal time in degrees"""
+    Tu = (jd_ut - J2000) / 36525.0
+    return (280.46061837 + 360.98564736629 * (jd_ut - J2000) + 0.000387933 * Tu ** 2 - Tu ** 3 / 38710000) % 360.0
+
+
+def obliquity(T):
+    """Mean obliquity of the ecliptic in degrees"""
+    return 23.439291111 - 0.013004167 * T - 1.639e-7 * T ** 2 + 5.036e-7 * T ** 3
+
+
+def _sun(T, earth):
+    """Apparent geocentric longitude of the Sun (J2000 ecliptic)"""
+    return np.degrees(np.arctan2(-earth[1], -earth[0])) - ABERRATION
+
+
+def sun_moon(jd_ut):
+    """Apparent tropical longitudes of the Sun and Moon (mean equinox of date) and T, for Julian days (UT)"""
+    _require_numpy()
+    jd_ut = np.atleast_1d(np.asarray(jd_ut, dtype=float))
+    T = julian_centuries(jd_ut)
+    sun = _sun(T, _heliocentric("Earth", T)) + general_precession(T)
+    return sun % 360.0, _moon(T) % 360.0, T
+
+
+def _ascendant(jd_ut, T, latitude, longitude):
+    """Tropical ascendant, mean equinox of date"""
+    ramc = np.radians((mean_sidereal_time(jd_ut) + longitude) % 360.0)
+    eps = np.radians(obliquity(T))
+    phi = np.radians(latitude)
+    return np.degrees(np.arctan2(-np.cos(ramc), np.sin(eps) * np.tan(phi) + np.cos(eps) * np.sin(ramc))) + 180.0
+
+
+def tropical_longitudes(jd_ut, latitude, longitude):
+    """Apparent tropical longitudes (mean equinox of date) for arrays of Julian days (UT)"""
+    _require_numpy()
+    jd_ut = np.atleast_1d(np.asarray(jd_ut, dtype=float))
+    T = julian_centuries(jd_ut)
+    precession = general_precession(T)
+
+    earth = _heliocentric("Earth", T)
+    sun = _sun(T, earth)
+    result = {"Sun": sun + precession}
+    for name in ("Mercury", "Venus", "Mars", "Jupiter", "Saturn"):
+        result[name] = _geocentric_planet(name, T, earth, sun) + precession
+    result["Moon"] = _moon(T)
+    result["Rahu"] = _mean_node(T)
+    result["Ketu"] = result["Rahu"] + 180.0
+    result["Ascendant"] = _ascendant(jd_ut, T, np.asarray(latitude, dtype=float), np.asarray(longitude, dtype=float))
+    return {name: values % 360.0 for name, values in result.items()}, T
+
+
+def sidereal_longitudes(jd_ut, latitude, longitude):
+    """Lahiri sidereal longitudes: {name: array} for arrays of Julian days (UT)"""
+    tropical, T = tropical_longitudes(jd_ut, latitude, longitude)
+    ayanamsa = lahiri_ayanamsa(T)
+    return {name: (values - ayanamsa) % 360.0 for name, values in tropical.items()}
+
+
+def planet_position_data(dt, latitude, longitude):
+    """Local equivalent of the planet-position "data" for one aware datetime (English names)"""
+    jd = julian_day(dt)
+    # A second sample an hour later gives the direction of motion
+    now = sidereal_longitudes(jd, latitude, longitude)
+    later = sidereal_longitudes(jd + 1 / 24, latitude, longitude)
+    ascendant_sign = int(now["Ascendant"][0] // 30)
+    positions = []
+    for name, planet_id in PLANET_IDS.items():
+        value = float(now[name][0])
+        motion = (float(later[name][0]) - value + 180.0) % 360.0 - 180.0
+        sign = int(value // 30)
+        positions.append({
+            "id": planet_id,
+            "name": name,
+            "longitude": round(value, 6),
+            "is_retrograde": name not in ("Ascendant", "Sun", "Moon") and motion < 0,
+            "position": (sign - ascendant_sign) % 12 + 1,
+            "degree": round(value % 30, 6),
+            "rasi": {"id": sign, "name": RASIS[sign]},
+        })
+    return {"planet_position": positions}
+
+
+def validate(fixture_path):
+    """Compare against recorded planet-position responses; returns {planet: (max, mean, n)}"""
+    from canonical import parse_datetime
+    from replay import FixtureStore
+
+    store = FixtureStore(fixture_path)
+    errors = {}
+    for key, status, body in store.items("GET /v2/astrology/planet-position?"):
+        if status != 200:
+            continue
+        params = json.loads(key.split("?", 1)[1])
+        latitude, longitude = (float(part) for part in params["coordinates"].split(","))
+        ours = sidereal_longitudes(julian_day(parse_datetime(params["datetime"])), latitude, longitude)
+        for planet in json.loads(body)["data"]["planet_position"]:
+            name = next((n for n, pid in PLANET_IDS.items() if pid == planet["id"]), None)
+            if name is None:
+                continue
+            diff = abs((float(ours[name][0]) - float(planet["longitude"]) + 180.0) % 360.0 - 180.0)
+            errors.setdefault(name, []).append(diff)
+    store.close()
+    return {name: (max(diffs), sum(diffs) / len(diffs), len(diffs)) for name, diffs in errors.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--validate", metavar="FIXTURES", required=True,
+                        help="Fixture store recorded with PROKERALA_UPSTREAM_MODE=record")
+    args = parser.parse_args()
+
+    results = validate(args.validate)
+    if not results:
+        print("No recorded planet-position responses found")
+        return
+    failed = False
+    print(f"{'planet':<12}{'samples':>8}{'max deg':>10}{'mean deg':>10}{'limit':>8}")
+    for name in PLANET_IDS:
+        if name not in results:
+            continue
+        worst, mean, count = results[name]
+        ok = worst <= TOLERANCES[name]
+        failed = failed or not ok
+        print(f"{name:<12}{count:>8}{worst:>10.4f}{mean:>10.4f}{TOLERANCES[name]:>8}{'' if ok else '  FAIL'}")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+"""Offline place lookup: place name -> canonical coordinates and IANA timezone
+
+The gazetteer is a TSV file (gazetteer.tsv ships a few hundred Indian and
+diaspora cities; a full GeoNames dump can be imported with --import).
+On first lookup it is compiled into a binary index of sorted normalized
+names (official and alternate) next to offsets into the records. The index
+is memory-mapped, so only the pages a lookup touches are read, and an
+exact or prefix match is a binary search of a few dozen byte slices.
+
+    python gazetteer.py --import cities15000.txt --admin1 admin1CodesASCII.txt --output gazetteer.tsv
+    python gazetteer.py "Kollam, Kerala"
+"""
+import argparse
+import bisect
+import logging
+import mmap
+import os
+import struct
+import threading
+import unicodedata
+from array import array
+from datetime import datetime
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+logger = logging.getLogger("pyyan")
+
+DEFAULT_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gazetteer.tsv")
+
+COLUMNS = ("name", "alternate_names", "state", "country", "latitude", "longitude", "timezone", "population")
+
+COUNTRY_NAMES = {
+    "AE": "United Arab Emirates", "AU": "Australia", "BD": "Bangladesh", "BH": "Bahrain", "BT": "Bhutan",
+    "CA": "Canada", "DE": "Germany", "FJ": "Fiji", "FR": "France", "GB": "United Kingdom", "HK": "Hong Kong",
+    "IE": "Ireland", "IN": "India", "JP": "Japan", "KE": "Kenya", "KW": "Kuwait", "LK": "Sri Lanka",
+    "MU": "Mauritius", "MV": "Maldives", "MY": "Malaysia", "NL": "Netherlands", "NP": "Nepal",
+    "NZ": "New Zealand", "OM": "Oman", "PK": "Pakistan", "QA": "Qatar", "SA": "Saudi Arabia",
+    "SG": "Singapore", "TH": "Thailand", "US": "United States", "ZA": "South Africa",
+}
+
+# Common state abbreviations (ISO 3166-2, Indian vehicle registration and postal codes) by (country, state)
+STATE_CODES = {
+    ("IN", "Andhra Pradesh"): ("AP",), ("IN", "Arunachal Pradesh"): ("AR",), ("IN", "Assam"): ("AS",),
+    ("IN", "Bihar"): ("BR",), ("IN", "Chandigarh"): ("CH",), ("IN", "Chhattisgarh"): ("CG", "CT"),
+    ("IN", "Delhi"): ("DL",), ("IN", "Goa"): ("GA",), ("IN", "Gujarat"): ("GJ",), ("IN", "Haryana"): ("HR",),
+    ("IN", "Himachal Pradesh"): ("HP",), ("IN", "Jammu and Kashmir"): ("JK",), ("IN", "Jharkhand"): ("JH",),
+    ("IN", "Karnataka"): ("KA",), ("IN", "Kerala"): ("KL",), ("IN", "Madhya Pradesh"): ("MP",),
+    ("IN", "Maharashtra"): ("MH",), ("IN", "Manipur"): ("MN",), ("IN", "Meghalaya"): ("ML",),
+    ("IN", "Mizoram"): ("MZ",), ("IN", "Nagaland"): ("NL",), ("IN", "Odisha"): ("OD", "OR"),
+    ("IN", "Puducherry"): ("PY",), ("IN", "Punjab"): ("PB",), ("IN", "Rajasthan"): ("RJ",),
+    ("IN", "Sikkim"): ("SK",), ("IN", "Tamil Nadu"): ("TN",), ("IN", "Telangana"): ("TS", "TG"),
+    ("IN", "Tripura"): ("TR",), ("IN", "Uttar Pradesh"): ("UP",), ("IN", "Uttarakhand"): ("UK", "UT"),
+    ("IN", "West Bengal"): ("WB",),
+    ("US", "California"): ("CA",), ("US", "District of Columbia"): ("DC",), ("US", "Georgia"): ("GA",),
+    ("US", "Illinois"): ("IL",), ("US", "Massachusetts"): ("MA",), ("US", "New Jersey"): ("NJ",),
+    ("US", "New York"): ("NY",), ("US", "Texas"): ("TX",), ("US", "Washington"): ("WA",),
+    ("AU", "New South Wales"): ("NSW",), ("AU", "Victoria"): ("VIC",),
+    ("CA", "British Columbia"): ("BC",), ("CA", "Ontario"): ("ON",),
+}
+
+# Index layout (native byte order; the index is rebuilt on the host that uses it):
+# magic, source mtime_ns and size, record and key counts, then
+# record offsets[n_records + 1], key offsets[n_keys + 1], key -> record[n_keys],
+# the records (UTF-8 TSV lines without alternate names) and the sorted keys.
+MAGIC = b"GAZ1"
+HEADER = struct.Struct("=4sqqII")
+
+MAX_FUZZY_DISTANCE = 2
+MAX_PREFIX_KEYS = 256  # names scanned for prefix matches, so "k" doesn't walk the whole index
+
+
+def normalize(text):
+    """Case- and accent-insensitive form used for matching: "Kōchi (Cochin)" -> "kochi cochin" """
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
+    return " ".join("".join(ch if ch.isalnum() else " " for ch in stripped).split())
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance between a and b, or limit + 1 once it exceeds limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def read_source(path):
+    """Yield records (dicts of COLUMNS) from a gazetteer TSV"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) != len(COLUMNS):
+                raise ValueError(f"{path}: expected {len(COLUMNS)} columns, got {len(fields)}: {line.strip()}")
+            yield dict(zip(COLUMNS, fields))
+
+
+def build_index(source, index_path):
+    """Compile a gazetteer TSV into the memory-mappable index"""
+    records, keys = [], []
+    for record in read_source(source):
+        record_id = len(records)
+        line = "\t".join(record[column] for column in COLUMNS if column != "alternate_names")
+        records.append(line.encode())
+        names = {normalize(record["name"])}
+        names.update(normalize(name) for name in record["alternate_names"].split(",") if name.strip())
+        keys.extend((name.encode(), record_id) for name in names if name)
+    keys.sort()
+
+    record_offsets, key_offsets = array("I", [0]), array("I", [0])
+    for record in records:
+        record_offsets.append(record_offsets[-1] + len(record))
+    for key, _ in keys:
+        key_offsets.append(key_offsets[-1] + len(key))
+    key_records = array("I", (record_id for _, record_id in keys))
+
+    stat = os.stat(source)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, stat.st_mtime_ns, stat.st_size, len(records), len(keys)))
+        for table in (record_offsets, key_offsets, key_records):
+            table.tofile(f)
+        f.write(b"".join(records))
+        f.write(b"".join(key for key, _ in keys))
+    os.replace(tmp_path, index_path)
+    logger.info(f"Built gazetteer index {index_path}: {len(records)} places, {len(keys)} names")
+
+
+class Gazetteer:
+    """Lazily loaded, memory-mapped place index
+
+    Nothing is read until the first search. The index is rebuilt when it
+    is missing or the source TSV has changed.
+    """
+
+    def __init__(self, source=DEFAULT_SOURCE, index_path="gazetteer.idx"):
+        self.source = source
+        self.index_path = index_path
+        self._lock = threading.Lock()
+        self._mmap = None
+
+    @property
+    def loaded(self):
+        return self._mmap is not None
+
+    def load(self):
+        with self._lock:
+            if self._mmap is not None:
+                return
+            if not self._index_current():
+                build_index(self.source, self.index_path)
+            with open(self.index_path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            _, _, _, n_records, n_keys = HEADER.unpack_from(mm)
+            view = self._view = memoryview(mm)
+            start = HEADER.size
+            self._record_offsets = view[start:start + 4 * (n_records + 1)].cast("I")
+            start += 4 * (n_records + 1)
+            self._key_offsets = view[start:start + 4 * (n_keys + 1)].cast("I")
+            start += 4 * (n_keys + 1)
+            self._key_records = view[start:start + 4 * n_keys].cast("I")
+            start += 4 * n_keys
+            self._records_start = start
+            self._keys_start = start + self._record_offsets[n_records]
+            self._n_keys = n_keys
+            self._mmap = mm
+
+    def search(self, query, limit=5):
+        """Best matches for "Place" or "Place, State/Country", most populous first within each match kind
+
+        Returns dicts with name, state, country, latitude, longitude,
+        timezone, population and match ("exact", "prefix" or "fuzzy").
+        """
+        if self._mmap is None:
+            self.load()
+        parts = [normalize(part) for part in query.split(",")]
+        name, qualifiers = parts[0], [part for part in parts[1:] if part]
+        if not name:
+            return []
+        matches = self._search(name, qualifiers, limit)
+        # "Kollam Kerala": treat trailing words as qualifiers when the whole name finds nothing
+        words = name.split()
+        for split in range(len(words) - 1, 0, -1):
+            if matches:
+                break
+            matches = self._search(" ".join(words[:split]), [" ".join(words[split:])] + qualifiers, limit)
+        return matches
+
+    def _search(self, name, qualifiers, limit):
+        key = name.encode()
+        found, seen = [], set()
+
+        def collect(indexes, kind):
+            ranked = []
+            for i in indexes:
+                record_id = self._key_records[i]
+                if record_id in seen:
+                    continue
+                seen.add(record_id)
+                record = self._record(record_id)
+                if all(_qualifies(record, qualifier) for qualifier in qualifiers):
+                    ranked.append({**record, "match": kind})
+            ranked.sort(key=lambda r: -r["population"])
+            found.extend(ranked)
+
+        first = self._bisect(key)
+        end = first
+        while end < self._n_keys and self._key(end) == key:
+            end += 1
+        collect(range(first, end), "exact")
+
+        prefix_end = end
+        while (prefix_end < self._n_keys and prefix_end - end < MAX_PREFIX_KEYS
+               and self._key(prefix_end).startswith(key)):
+            prefix_end += 1
+        collect(range(end, prefix_end), "prefix")
+
+        if not found:
+            collect(self._fuzzy(name), "fuzzy")
+        return found[:limit]
+
+    def _fuzzy(self, name):
+        """Key indexes within MAX_FUZZY_DISTANCE of name, among keys with the same first letter"""
+        limit = min(MAX_FUZZY_DISTANCE, max(1, len(name) // 4))
+        initial = name[0].encode()
+        start, stop = self._bisect(initial), self._bisect(initial + b"\xff")
+        scored = []
+        for i in range(start, stop):
+            candidate = self._key(i).decode()
+            distance = edit_distance(name, candidate, limit)
+            if distance <= limit:
+                scored.append((distance, i))
+        return [i for _, i in sorted(scored)]
+
+    def _bisect(self, key):
+        return bisect.bisect_left(range(self._n_keys), key, key=self._key)
+
+    def _key(self, i):
+        start = self._keys_start
+        return self._mmap[start + self._key_offsets[i]:start + self._key_offsets[i + 1]]
+
+    def _record(self, record_id):
+        start = self._records_start
+        line = self._mmap[start + self._record_offsets[record_id]:start + self._record_offsets[record_id + 1]]
+        name, state, country, latitude, longitude, timezone, population = line.decode().split("\t")
+        return {
+            "name": name,
+            "state": state,
+            "country": country,
+            "latitude": float(latitude),
+            "longitude": float(longitude),
+            "timezone": timezone,
+            "population": int(population or 0),
+        }
+
+    def _index_current(self):
+        try:
+            with open(self.index_path, "rb") as f:
+                magic, mtime_ns, size, _, _ = HEADER.unpack(f.read(HEADER.size))
+        except (FileNotFoundError, struct.error):
+            return False
+        stat = os.stat(self.source)
+        return magic == MAGIC and mtime_ns == stat.st_mtime_ns and size == stat.st_size
+
+    def close(self):
+        with self._lock:
+            if self._mmap is not None:
+                self._record_offsets.release()
+                self._key_offsets.release()
+                self._key_records.release()
+                self._view.release()
+                self._mmap.close()
+                self._mmap = None
+
+
+def _qualifies(record, qualifier):
+    """Whether "Kerala", "kl"-style or country qualifiers fit a record (allowing a typo)"""
+    country = record["country"]
+    if qualifier.upper() in STATE_CODES.get((country, record["state"]), ()):
+        return True
+    candidates = (normalize(record["state"]), country.lower(), normalize(COUNTRY_NAMES.get(country, "")))
+    for candidate in candidates:
+        if candidate and (candidate.startswith(qualifier) or
+                          (len(qualifier) > 4 and edit_distance(qualifier, candidate, 1) <= 1)):
+            return True
+    return False
+
+
+def utc_offset(timezone):
+    """Current UTC offset of an IANA timezone as "+05:30", or None if it is unknown here"""
+    try:
+        return datetime.now(ZoneInfo(timezone)).isoformat(timespec="seconds")[-6:]
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def import_geonames(cities_path, admin1_path, output):
+    """Convert a GeoNames cities dump (e.g. cities15000.txt) into a gazetteer TSV"""
+    states = {}
+    if admin1_path:
+        with open(admin1_path, encoding="utf-8") as f:
+            for line in f:
+                code, name = line.split("\t")[:2]
+                states[code] = name
+    count = 0
+    tmp_path = f"{output}.{os.getpid()}.tmp"
+    with open(cities_path, encoding="utf-8") as src, open(tmp_path, "w", encoding="utf-8") as out:
+        out.write("# " + "\t".join(COLUMNS) + "\n")
+        for line in src:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 18:
+                continue
+            name, ascii_name, alternates = fields[1], fields[2], fields[3]
+            names = [n for n in [ascii_name] + alternates.split(",") if n and n != name and "\t" not in n]
+            state = states.get(f"{fields[8]}.{fields[10]}", "")
+            out.write("\t".join([name, ",".join(dict.fromkeys(names)), state, fields[8], fields[4], fields[5],
+                                 fields[17], fields[14] or "0"]) + "\n")
+            count += 1
+    os.replace(tmp_path, output)
+    print(f"Wrote {count} places to {output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("query", nargs="?", help="Place to look up")
+    parser.add_argument("--source", default=DEFAULT_SOURCE, help="Gazetteer TSV")
+    parser.add_argument("--index", default="gazetteer.idx", help="Index file built from the TSV")
+    parser.add_argument("--import", dest="import_path", help="GeoNames cities file to convert into --output")
+    parser.add_argument("--admin1", help="GeoNames admin1CodesASCII.txt for state names")
+    parser.add_argument("--output", default=DEFAULT_SOURCE, help="TSV written by --import")
+    args = parser.parse_args()
+
+    if args.import_path:
+        import_geonames(args.import_path, args.admin1, args.output)
+        return
+    if not args.query:
+        parser.error("a query or --import is required")
+    for match in Gazetteer(args.source, args.index).search(args.query):
+        print("\t".join(str(match[key]) for key in ("match", "name", "state", "country", "latitude", "longitude", "timezone")))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,90 @@
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# "compact" (no whitespace, UTF-8) or "pretty" (indent=2, the old tool output)
+OUTPUT_FORMAT = os.getenv("PROKERALA_OUTPUT_FORMAT", "compact").lower()
+
+
+def loads(content):
+    """Decode JSON bytes or text, with orjson when it's installed"""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def dumps(data, pretty=None, ensure_ascii=False):
+    """Encode a tool result; pretty defaults to PROKERALA_OUTPUT_FORMAT
+
+    ensure_ascii only applies to pretty output, compact output is always UTF-8.
+    """
+    if pretty is None:
+        pretty = OUTPUT_FORMAT == "pretty"
+    if pretty:
+        return json.dumps(data, indent=2, ensure_ascii=ensure_ascii)
+    if orjson is not None:
+        return orjson.dumps(data).decode()
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def fingerprint(data):
+    """Stable encoding for equality checks (sorted keys)"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(data, sort_keys=True, ensure_ascii=False)
+
+
+def parse_fields(fields):
+    """Split "a.b, c" into [["a", "b"], ["c"]]; empty means everything"""
+    if not fields:
+        return []
+    if isinstance(fields, str):
+        fields = fields.split(",")
+    return [field.strip().split(".") for field in fields if field.strip()]
+
+
+def project(data, fields):
+    """Keep only the given dotted paths of data
+
+    Paths step into every element of a list, so "planet_position.name"
+    keeps just the names of all planets. Paths that don't exist are
+    ignored.
+    """
+    paths = parse_fields(fields)
+    if not paths:
+        return data
+    tree = {}
+    for path in paths:
+        node = tree
+        for key in path[:-1]:
+            if key in node and node[key] is None:
+                break  # the whole parent is already kept
+            node = node.setdefault(key, {})
+        else:
+            node[path[-1]] = None  # None marks "keep the whole value"
+    return _select(data, tree)
+
+
+def _select(data, tree):
+    if isinstance(data, list):
+        return [_select(item, tree) for item in data]
+    if not isinstance(data, dict):
+        return data
+    selected = {}
+    for key, subtree in tree.items():
+        if key in data:
+            selected[key] = data[key] if subtree is None else _select(data[key], subtree)
+    return selected
+
+
+def project_response(payload, fields):
+    """Project the "data" of a Prokerala response envelope, keeping the envelope"""
+    if not parse_fields(fields):
+        return payload
+    if isinstance(payload, dict) and isinstance(payload.get("data"), (dict, list)):
+        return {**payload, "data": project(payload["data"], fields)}
+    return project(payload, fields)
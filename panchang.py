@@ -0,0 +1,262 @@
+"""Local panchang engine on top of ephemeris.py
+
+Tithi, nakshatra, yoga and karana are functions of the Sun and Moon
+longitudes only, so their transition times are the same everywhere. A
+year of transitions is found once by vectorized bisection on an hourly
+grid and saved as a small .npy table (about 20 KB) that is memory-mapped
+on later loads. Sunrise/sunset depend on the location, so they are
+computed per request (one vectorized call for all requested days). Day
+lookups are then two searchsorted calls per element.
+
+Tables are built on first use; to build them ahead of time:
+
+    python panchang.py --tables panchang_tables --year 2025 --year 2026
+"""
+import argparse
+import logging
+import os
+import threading
+from datetime import date, datetime, timedelta, timezone
+
+import ephemeris
+from ephemeris import np
+
+logger = logging.getLogger("pyyan")
+
+TITHIS = ["Pratipada", "Dwitiya", "Tritiya", "Chaturthi", "Panchami", "Shashthi", "Saptami", "Ashtami",
+          "Navami", "Dashami", "Ekadashi", "Dwadashi", "Trayodashi", "Chaturdashi"]
+NAKSHATRAS = ["Ashwini", "Bharani", "Krittika", "Rohini", "Mrigashira", "Ardra", "Punarvasu",
+              "Pushya", "Ashlesha", "Magha", "Purva Phalguni", "Uttara Phalguni", "Hasta",
+              "Chitra", "Swati", "Vishakha", "Anuradha", "Jyeshtha", "Mula", "Purva Ashadha",
+              "Uttara Ashadha", "Shravana", "Dhanishta", "Shatabhisha", "Purva Bhadrapada",
+              "Uttara Bhadrapada", "Revati"]
+YOGAS = ["Vishkambha", "Priti", "Ayushman", "Saubhagya", "Shobhana", "Atiganda", "Sukarma", "Dhriti",
+         "Shula", "Ganda", "Vriddhi", "Dhruva", "Vyaghata", "Harshana", "Vajra", "Siddhi", "Vyatipata",
+         "Variyana", "Parigha", "Shiva", "Siddha", "Sadhya", "Shubha", "Shukla", "Brahma", "Indra", "Vaidhriti"]
+MOVABLE_KARANAS = ["Bava", "Balava", "Kaulava", "Taitila", "Garaja", "Vanija", "Vishti"]
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# Element -> (number of divisions of the circle, degrees per division), in table order
+ELEMENTS = {"tithi": (30, 12.0), "nakshatra": (27, 40 / 3), "yoga": (27, 40 / 3), "karana": (60, 6.0)}
+ELEMENT_CODES = {name: code for code, name in enumerate(ELEMENTS)}
+
+TRANSITION_DTYPE = np.dtype([("element", "u1"), ("index", "u1"), ("start", "<f8")]) if np is not None else None
+
+GRID_HOURS = 1.0          # every element lasts well over an hour, so a grid cell holds at most one change
+BISECTIONS = 22           # 1 h / 2**22 is under a millisecond
+MARGIN_DAYS = 3           # tables overlap neighbouring years so every day of the year is covered
+SUNRISE_ALTITUDE = -0.833 # upper limb with standard refraction
+
+
+def element_name(element, index):
+    """English name (and paksha for tithis) of an element index"""
+    if element == "tithi":
+        paksha = "Shukla Paksha" if index < 15 else "Krishna Paksha"
+        if index in (14, 29):
+            return ("Purnima" if index == 14 else "Amavasya"), paksha
+        return TITHIS[index % 15], paksha
+    if element == "nakshatra":
+        return NAKSHATRAS[index], None
+    if element == "yoga":
+        return YOGAS[index], None
+    if index == 0:
+        return "Kimstughna", None
+    if index >= 57:
+        return ["Shakuni", "Chatushpada", "Naga"][index - 57], None
+    return MOVABLE_KARANAS[(index - 1) % 7], None
+
+
+def element_angles(jd_ut):
+    """Angles (0-360) driving each element, in ELEMENTS order, as a (4, n) array"""
+    sun, moon, T = ephemeris.sun_moon(jd_ut)
+    ayanamsa = ephemeris.lahiri_ayanamsa(T)
+    elongation = (moon - sun) % 360.0
+    return np.stack([
+        elongation,                                  # tithi
+        (moon - ayanamsa) % 360.0,                   # nakshatra
+        (sun + moon - 2 * ayanamsa) % 360.0,         # yoga
+        elongation,                                  # karana
+    ])
+
+
+def find_transitions(jd_start, jd_end):
+    """All element changes between two Julian days (UT) as a TRANSITION_DTYPE array sorted by element, start"""
+    ephemeris._require_numpy()
+    grid = np.arange(jd_start, jd_end + GRID_HOURS / 24, GRID_HOURS / 24)
+    raw = element_angles(grid)
+    widths = np.array([width for _, width in ELEMENTS.values()])
+    counts = np.array([count for count, _ in ELEMENTS.values()])
+
+    elements, cells, targets = [], [], []
+    for code in range(len(ELEMENTS)):
+        unwrapped = np.unwrap(raw[code], period=360.0)
+        division = np.floor(unwrapped / widths[code])
+        changed = np.nonzero(np.diff(division) > 0)[0]
+        elements.append(np.full(len(changed), code))
+        cells.append(changed)
+        # Target angle relative to the raw angle at the start of the cell
+        targets.append((division[changed] + 1) * widths[code] - unwrapped[changed])
+    elements, cells, targets = np.concatenate(elements), np.concatenate(cells), np.concatenate(targets)
+
+    # Bisect every crossing at once; each step evaluates the Sun and Moon once for all of them
+    lo, hi = grid[cells], grid[cells + 1]
+    base = raw[elements, cells]
+    for _ in range(BISECTIONS):
+        mid = (lo + hi) / 2
+        advanced = (element_angles(mid)[elements, np.arange(len(mid))] - base) % 360.0
+        before = advanced < targets
+        lo = np.where(before, mid, lo)
+        hi = np.where(before, hi, mid)
+
+    table = np.empty(len(elements), dtype=TRANSITION_DTYPE)
+    table["element"] = elements
+    table["index"] = (np.round((base + targets) / widths[elements]) % counts[elements]).astype(int)
+    table["start"] = hi
+    return np.sort(table, order=["element", "start"])
+
+
+def _low_precision_sun(jd_ut):
+    """Apparent solar longitude to about 0.01 deg (Meeus ch. 25), plenty for rise/set times"""
+    T = (jd_ut - 2451545.0) / 36525.0
+    mean_anomaly = np.radians(357.52911 + 35999.05029 * T)
+    centre = ((1.914602 - 0.004817 * T) * np.sin(mean_anomaly) + 0.019993 * np.sin(2 * mean_anomaly)
+              + 0.000289 * np.sin(3 * mean_anomaly))
+    node = np.radians(125.04 - 1934.136 * T)
+    return (280.46646 + 36000.76983 * T + centre - 0.00569 - 0.00478 * np.sin(node)) % 360.0, T
+
+
+def sun_times(days, latitude, longitude):
+    """Sunrise and sunset Julian days (UT) for an array of Julian days at 0h UT of each date
+
+    Polar day or night gives NaN.
+    """
+    phi = np.radians(latitude)
+
+    def solve(guess, sign):
+        jd = guess
+        for _ in range(3):
+            sun, T = _low_precision_sun(jd)
+            lam, eps = np.radians(sun), np.radians(ephemeris.obliquity(T))
+            ra = np.degrees(np.arctan2(np.cos(eps) * np.sin(lam), np.cos(lam)))
+            dec = np.arcsin(np.sin(eps) * np.sin(lam))
+            hour_angle = (ephemeris.mean_sidereal_time(jd) + longitude - ra + 180.0) % 360.0 - 180.0
+            cos_h0 = (np.sin(np.radians(SUNRISE_ALTITUDE)) - np.sin(phi) * np.sin(dec)) / (np.cos(phi) * np.cos(dec))
+            h0 = np.degrees(np.arccos(np.where(np.abs(cos_h0) <= 1, cos_h0, np.nan)))
+            jd = jd - (hour_angle - sign * h0) / 360.98564736629
+        return jd
+
+    # Rises and sets are solved together, which halves the ephemeris calls
+    noon = np.asarray(days, dtype=float) + 0.5 - longitude / 360.0
+    count = len(noon)
+    times = solve(np.concatenate([noon - 0.25, noon + 0.25]), np.repeat([-1.0, 1.0], count))
+    return times[:count], times[count:]
+
+
+class PanchangTables:
+    """Yearly transition tables, built on first use and memory-mapped afterwards
+
+    There is one small table per year, shared by every location, so the
+    number of open mappings is bounded by the years in use.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._loaded = {}
+        self._lock = threading.Lock()
+
+    def transitions(self, year):
+        """{element: (start times, indexes)} covering the given year (plus a few days either side)"""
+        def build():
+            start = _julian_day(date(year, 1, 1)) - MARGIN_DAYS
+            end = _julian_day(date(year + 1, 1, 1)) + MARGIN_DAYS
+            return find_transitions(start, end)
+
+        def split(table):
+            bounds = np.searchsorted(table["element"], np.arange(len(ELEMENTS) + 1))
+            return {element: (table["start"][bounds[code]:bounds[code + 1]], table["index"][bounds[code]:bounds[code + 1]])
+                    for element, code in ELEMENT_CODES.items()}
+
+        return self._table(f"transitions-{year}.npy", build, split)
+
+    def _table(self, name, build, view=None):
+        table = self._loaded.get(name)
+        if table is not None:
+            return table
+        with self._lock:
+            table = self._loaded.get(name)
+            if table is not None:
+                return table
+            path = os.path.join(self.root, name)
+            if not os.path.exists(path):
+                data = build()
+                os.makedirs(self.root, exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+                np.save(tmp_path, data)
+                os.replace(tmp_path, path)
+                logger.info(f"Built panchang table {name} ({data.nbytes} bytes)")
+            # Plain ndarray views of the mapping skip np.memmap's per-access overhead
+            table = np.asarray(np.load(path, mmap_mode="r"))
+            table = self._loaded[name] = view(table) if view else table
+        return table
+
+
+def _julian_day(day):
+    """Julian day (UT) at 0h UTC of a date"""
+    return day.toordinal() + 1721424.5
+
+
+def _to_datetime(jd, tz):
+    seconds = round((float(jd) - 2440587.5) * 86400.0)
+    return (datetime(1970, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=seconds)).astimezone(tz)
+
+
+def days_panchang(tables, days, latitude, longitude, tz):
+    """Panchang "data" for each local date in days, shaped like the Prokerala response (English names)
+
+    Lists every tithi, nakshatra, yoga and karana in force between a
+    day's sunrise and the next, with start/end times in the caller's timezone.
+    """
+    day_jds = np.array([_julian_day(day) for day in days], dtype=float)
+    rises, sets = sun_times(np.concatenate([day_jds, day_jds + 1]), latitude, longitude)
+    count = len(days)
+    results = []
+    for n, day in enumerate(days):
+        sunrise, sunset, next_sunrise = rises[n], sets[n], rises[count + n]
+        if np.isnan(sunrise) or np.isnan(next_sunrise):
+            raise ValueError("The Sun does not rise on this date at this latitude")
+        data = {"vaara": WEEKDAYS[day.weekday()]}
+        for element, (starts, indexes) in tables.transitions(day.year).items():
+            first = max(int(starts.searchsorted(sunrise, side="right")) - 1, 0)
+            last = int(starts.searchsorted(next_sunrise, side="left"))
+            entries = []
+            for i in range(first, last):
+                index = int(indexes[i])
+                name, paksha = element_name(element, index)
+                entry = {"id": index, "name": name, "start": _to_datetime(starts[i], tz).isoformat()}
+                if i + 1 < len(starts):
+                    entry["end"] = _to_datetime(starts[i + 1], tz).isoformat()
+                if paksha is not None:
+                    entry["paksha"] = paksha
+                entries.append(entry)
+            data[element] = entries
+        data["sunrise"] = _to_datetime(sunrise, tz).isoformat()
+        data["sunset"] = _to_datetime(sunset, tz).isoformat()
+        results.append(data)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tables", default="panchang_tables", help="Table directory")
+    parser.add_argument("--year", type=int, action="append", required=True, help="Year to build (repeatable)")
+    args = parser.parse_args()
+
+    tables = PanchangTables(args.tables)
+    for year in args.year:
+        tables.transitions(year)
+    print(f"Tables in {args.tables}: {', '.join(sorted(os.listdir(args.tables)))}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
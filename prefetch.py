@@ -0,0 +1,79 @@
+import asyncio
+import logging
+from datetime import datetime, time, timedelta, timezone
+
+logger = logging.getLogger("pyyan")
+
+
+class DailyPrefetcher:
+    """Run a day's prefetch jobs shortly after local midnight in each timezone
+
+    jobs(zone, midnight) returns a list of (kind, coroutine function) pairs
+    for the day starting at midnight (an aware datetime in zone). A
+    timezone whose day has started but hasn't been prefetched yet (e.g.
+    after a restart) is prefetched straight away.
+    """
+
+    def __init__(self, timezones, jobs, delay=300, concurrency=4):
+        self.timezones = list(timezones)
+        self.jobs = jobs
+        self.delay = timedelta(seconds=delay)
+        self.concurrency = concurrency
+        self._done = {}
+        self._task = None
+        self.runs = 0
+        self.succeeded = 0
+        self.failed = 0
+
+    def ensure_started(self):
+        """Start the scheduler on the running event loop if it isn't running there yet"""
+        task = self._task
+        if task is not None and not task.done() and task.get_loop() is asyncio.get_running_loop():
+            return
+        self._task = asyncio.create_task(self._run())
+
+    def next_run(self, zone, now):
+        """(run time, local date) of the next prefetch for a timezone"""
+        day = now.astimezone(zone).date()
+        if self._done.get(str(zone)) == day:
+            day += timedelta(days=1)
+        return datetime.combine(day, time(), tzinfo=zone) + self.delay, day
+
+    async def prefetch_day(self, zone, day):
+        """Run every job for a local date with bounded concurrency; returns the failure count"""
+        midnight = datetime.combine(day, time(), tzinfo=zone)
+        jobs = self.jobs(zone, midnight)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run_one(kind, job):
+            async with semaphore:
+                try:
+                    await job()
+                    return kind, None
+                except Exception as e:
+                    return kind, e
+
+        results = await asyncio.gather(*(run_one(kind, job) for kind, job in jobs))
+        failures = [(kind, e) for kind, e in results if e is not None]
+        for kind, e in failures:
+            logger.warning(f"Prefetch of {kind} for {day} ({zone}) failed: {str(e)}")
+        self.runs += 1
+        self.succeeded += len(results) - len(failures)
+        self.failed += len(failures)
+        logger.info(f"Prefetched {len(results) - len(failures)}/{len(results)} responses for {day} ({zone})")
+        return len(failures)
+
+    async def _run(self):
+        while True:
+            now = datetime.now(timezone.utc)
+            zone = min(self.timezones, key=lambda z: self.next_run(z, now)[0])
+            run_at, day = self.next_run(zone, now)
+            await asyncio.sleep(max(0.0, (run_at - now).total_seconds()))
+            try:
+                await self.prefetch_day(zone, day)
+            except Exception as e:
+                logger.error(f"Prefetch for {day} ({zone}) failed: {str(e)}")
+            self._done[str(zone)] = day
+
+    def stats(self):
+        return {"runs": self.runs, "succeeded": self.succeeded, "failed": self.failed}
@@ -0,0 +1,224 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from email.utils import parsedate_to_datetime
+
+logger = logging.getLogger("pyyan")
+
+# Request priorities, lowest value is served first
+INTERACTIVE = 0
+BATCH = 1
+PREFETCH = 2
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch", PREFETCH: "prefetch"}
+
+
+class Priority:
+    """Priority of one logical request, shared by every send made for it
+
+    RateLimiter.promote() can raise it while the request is queued, e.g.
+    when an interactive caller joins a coalesced prefetch.
+    """
+
+    def __init__(self, level):
+        self.level = level
+        self._queued = {}
+
+
+class RateLimiter:
+    """Token bucket that queues excess requests by priority
+
+    The bucket starts with the configured rate and learns the real quota
+    from X-RateLimit-* and Retry-After response headers. A rate of 0
+    disables pacing; pauses from 429 responses still apply.
+    """
+
+    def __init__(self, rate=10.0, burst=20, window=60):
+        self.rate = rate
+        self.capacity = burst
+        self.window = window
+        self.tokens = float(burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._timer = None
+        self.wait_count = {name: 0 for name in PRIORITY_NAMES.values()}
+        self.wait_seconds = {name: 0.0 for name in PRIORITY_NAMES.values()}
+        self.max_wait_seconds = 0.0
+
+    async def acquire(self, priority=INTERACTIVE):
+        """Wait for a request slot; higher priority waiters are released first
+
+        priority is a level or a Priority that promote() may raise while waiting.
+        """
+        request = priority if isinstance(priority, Priority) else None
+        now = time.monotonic()
+        self._refill(now)
+        if not self._waiters and self._can_send(now):
+            self._take()
+            return 0.0
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        entry = [request.level if request else priority, next(self._sequence), future]
+        heapq.heappush(self._waiters, entry)
+        if request is not None:
+            request._queued[future] = entry
+        self._schedule(loop)
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Our slot may have been granted just as we were cancelled; hand it back
+            if future.done() and not future.cancelled():
+                self.tokens = min(self.capacity, self.tokens + 1)
+            raise
+        finally:
+            if request is not None:
+                request._queued.pop(future, None)
+
+        waited = time.monotonic() - now
+        level = request.level if request else priority
+        name = PRIORITY_NAMES.get(level, str(level))
+        self.wait_count[name] = self.wait_count.get(name, 0) + 1
+        self.wait_seconds[name] = self.wait_seconds.get(name, 0.0) + waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        return waited
+
+    def try_acquire(self):
+        """Take a request slot if one is free right now, without queueing; returns whether it did"""
+        now = time.monotonic()
+        self._refill(now)
+        if self._waiters or not self._can_send(now):
+            return False
+        self._take()
+        return True
+
+    def promote(self, request, level):
+        """Raise a Priority to level, moving its queued sends ahead of lower priority waiters"""
+        if level >= request.level:
+            return
+        request.level = level
+        for future, entry in list(request._queued.items()):
+            # Keep the original sequence number so it stays in arrival order among its new peers
+            promoted = [level, entry[1], future]
+            entry[2] = None
+            request._queued[future] = promoted
+            heapq.heappush(self._waiters, promoted)
+
+    def update_from_headers(self, status_code, headers):
+        """Learn the quota from response headers"""
+        limit = _header_number(headers, "X-RateLimit-Limit")
+        remaining = _header_number(headers, "X-RateLimit-Remaining")
+        reset = _header_number(headers, "X-RateLimit-Reset")
+
+        if limit and limit > 0:
+            rate = limit / self.window
+            if rate != self.rate or limit != self.capacity:
+                logger.info(f"Rate limit learned from headers: {limit} requests per {self.window}s")
+                self.rate = rate
+                self.capacity = limit
+        if remaining is not None:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, remaining)
+            if remaining <= 0 and reset:
+                self.pause(_seconds_until(reset))
+
+        if status_code == 429:
+            retry_after = _retry_after_seconds(headers.get("Retry-After"))
+            self.pause(retry_after if retry_after is not None else max(1.0, self.window / max(self.capacity, 1)))
+
+    def pause(self, seconds):
+        """Hold all requests for the given number of seconds"""
+        if seconds <= 0:
+            return
+        logger.warning(f"Upstream rate limited, pausing requests for {seconds:.1f}s")
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+    def stats(self):
+        """Queue depth and wait-time metrics"""
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, future in self._waiters:
+            if future is not None and not future.done():
+                name = PRIORITY_NAMES.get(priority, str(priority))
+                depth[name] = depth.get(name, 0) + 1
+        return {
+            "rate_per_second": self.rate,
+            "burst": self.capacity,
+            "tokens": round(self.tokens, 2),
+            "paused_for": round(max(0.0, self._blocked_until - time.monotonic()), 2),
+            "queue_depth": depth,
+            "waits": dict(self.wait_count),
+            "wait_seconds_total": {k: round(v, 3) for k, v in self.wait_seconds.items()},
+            "max_wait_seconds": round(self.max_wait_seconds, 3),
+        }
+
+    def _can_send(self, now):
+        return now >= self._blocked_until and (self.rate <= 0 or self.tokens >= 1)
+
+    def _take(self):
+        if self.rate > 0:
+            self.tokens -= 1
+
+    def _refill(self, now):
+        if self.rate > 0:
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _schedule(self, loop):
+        if self._timer is None:
+            self._timer = loop.call_soon(self._dispatch, loop)
+
+    def _dispatch(self, loop):
+        self._timer = None
+        now = time.monotonic()
+        self._refill(now)
+        while self._waiters:
+            _, _, future = self._waiters[0]
+            if future is None or future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if not self._can_send(now):
+                break
+            heapq.heappop(self._waiters)
+            self._take()
+            future.set_result(None)
+
+        if self._waiters:
+            delay = self._blocked_until - now
+            if self.rate > 0:
+                delay = max(delay, (1 - self.tokens) / self.rate)
+            self._timer = loop.call_later(max(delay, 0.001), self._dispatch, loop)
+
+
+def _header_number(headers, name):
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _seconds_until(reset):
+    # X-RateLimit-Reset is either seconds from now or an epoch timestamp
+    if reset > 1_000_000_000:
+        return reset - time.time()
+    return reset
+
+
+def _retry_after_seconds(value):
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return parsedate_to_datetime(value).timestamp() - time.time()
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,82 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+logger = logging.getLogger("pyyan")
+
+LIVE = "live"
+RECORD = "record"
+REPLAY = "replay"
+MODES = (LIVE, RECORD, REPLAY)
+
+
+class ReplayMissError(Exception):
+    """Raised in replay mode when no response was recorded for a request"""
+
+
+class FixtureStore:
+    """Recorded upstream responses keyed by method, endpoint and canonical params
+
+    A single SQLite file with zlib-compressed bodies, so a full recording
+    session can be checked in or shared as one small file. Calls block on
+    SQLite and compression; run them through asyncio.to_thread from async code.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS fixtures ("
+                "key TEXT PRIMARY KEY, status INTEGER NOT NULL, content_type TEXT NOT NULL, "
+                "body BLOB NOT NULL, recorded_at REAL NOT NULL)"
+            )
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+
+    def get(self, key):
+        """Return (status, content_type, body) or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, content_type, body FROM fixtures WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return row[0], row[1], zlib.decompress(row[2])
+
+    def put(self, key, status, content_type, body):
+        compressed = zlib.compress(body, 9)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO fixtures (key, status, content_type, body, recorded_at) VALUES (?, ?, ?, ?, ?)",
+                (key, status, content_type, compressed, time.time()),
+            )
+            self.recorded += 1
+
+    def items(self, prefix=""):
+        """Yield (key, status, body) for recorded responses whose key starts with prefix"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, status, body FROM fixtures WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)
+            ).fetchall()
+        for key, status, body in rows:
+            yield key, status, zlib.decompress(body)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM fixtures").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
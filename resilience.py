@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import random
+import time
+
+logger = logging.getLogger("pyyan")
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling upstream while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Fail fast after repeated upstream failures
+
+    Opens after `failure_threshold` consecutive failures. After
+    `reset_timeout` seconds one trial request is let through (half-open);
+    success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._trial_in_flight = False
+        self._trial_started = 0.0
+
+    def check(self):
+        """Raise CircuitOpenError unless a request may be sent now"""
+        if self.state == "closed":
+            return
+        remaining = self.opened_at + self.reset_timeout - time.monotonic()
+        if self.state == "open" and remaining <= 0:
+            self.state = "half-open"
+        if self.state == "half-open":
+            # A trial that never reported back (e.g. cancelled) doesn't block forever
+            stale_trial = time.monotonic() - self._trial_started > self.reset_timeout
+            if not self._trial_in_flight or stale_trial:
+                self._trial_in_flight = True
+                self._trial_started = time.monotonic()
+                return
+        raise CircuitOpenError(
+            f"Prokerala API is unavailable, failing fast (retry in {max(remaining, 0):.0f}s)"
+        )
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info("Circuit breaker closed")
+        self.state = "closed"
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == "half-open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning(f"Circuit breaker opened after {self.failures} failures")
+                self.times_opened += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def stats(self):
+        return {"state": self.state, "consecutive_failures": self.failures, "times_opened": self.times_opened}
+
+
+def backoff_delay(attempt, base=0.25, cap=8.0):
+    """Exponential backoff with full jitter for the given retry attempt (0-based)"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+async def hedged(make_call, delay, can_hedge=None):
+    """Run make_call(); if it hasn't finished after `delay` seconds, race a second copy
+
+    The first copy to finish wins and the other is cancelled. If the first
+    finisher failed, the other copy's result is used instead. When
+    can_hedge() returns False at that point, the first copy runs alone.
+    """
+    pending = {asyncio.ensure_future(make_call())}
+    error = None
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if done:
+            return done.pop().result()
+        if can_hedge is not None and not can_hedge():
+            return await next(iter(pending))
+
+        pending.add(asyncio.ensure_future(make_call()))
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,185 @@
+"""Local stand-in for the Prokerala API, for benchmarks and offline development
+
+Serves /token and the /v2/... endpoints used by coremcp.py with canned,
+deterministic responses, plus optional latency and error injection.
+
+    python stubserver.py --port 8765 --latency-ms 80 --jitter-ms 40 --error-rate 0.01
+
+Point the MCP server at it with PROKERALA_API_BASE=http://127.0.0.1:8765
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+import secrets
+import time
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+PLANETS = ["Sun", "Moon", "Mars", "Mercury", "Jupiter", "Venus", "Saturn", "Rahu", "Ketu"]
+# Planet ids as used by Prokerala
+PLANET_IDS = {"Ascendant": 100, "Sun": 0, "Moon": 1, "Mercury": 2, "Venus": 3, "Mars": 4,
+              "Jupiter": 5, "Saturn": 6, "Rahu": 101, "Ketu": 102}
+RASIS = ["Mesha", "Vrishabha", "Mithuna", "Karka", "Simha", "Kanya",
+         "Tula", "Vrischika", "Dhanu", "Makara", "Kumbha", "Meena"]
+NAKSHATRAS = ["Ashwini", "Bharani", "Krittika", "Rohini", "Mrigashira", "Ardra", "Punarvasu",
+              "Pushya", "Ashlesha", "Magha", "Purva Phalguni", "Uttara Phalguni", "Hasta",
+              "Chitra", "Swati", "Vishakha", "Anuradha", "Jyeshtha", "Mula", "Purva Ashadha",
+              "Uttara Ashadha", "Shravana", "Dhanishta", "Shatabhisha", "Purva Bhadrapada",
+              "Uttara Bhadrapada", "Revati"]
+
+
+class StubConfig:
+    def __init__(self, latency_ms=50.0, jitter_ms=0.0, error_rate=0.0, rate_limit=0, token_ttl=3600):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.token_ttl = token_ttl
+        self.tokens = set()
+        self.window_start = time.monotonic()
+        self.window_count = 0
+        self.requests = 0
+
+
+def _seeded(params):
+    """Deterministic RNG per request so identical requests get identical bodies"""
+    digest = hashlib.sha256(repr(sorted(params.items())).encode()).digest()
+    return random.Random(int.from_bytes(digest[:8], "big"))
+
+
+def _planets(rng):
+    positions = []
+    for name in ["Ascendant"] + PLANETS:
+        longitude = rng.uniform(0, 360)
+        if name == "Ketu":
+            longitude = (positions[-1]["longitude"] + 180) % 360
+        positions.append({
+            "id": PLANET_IDS[name],
+            "name": name,
+            "longitude": round(longitude, 6),
+            "is_retrograde": name not in ("Sun", "Moon", "Ascendant") and rng.random() < 0.2,
+            "position": int(longitude // 30) + 1,
+            "degree": round(longitude % 30, 6),
+            "rasi": {"id": int(longitude // 30), "name": RASIS[int(longitude // 30)]},
+        })
+    return positions
+
+
+def _nakshatra(rng):
+    index = rng.randrange(27)
+    return {"id": index, "name": NAKSHATRAS[index], "pada": rng.randint(1, 4)}
+
+
+def _body(path, params):
+    rng = _seeded({"path": path, **params})
+    if path.endswith("/panchang"):
+        return {"vaara": rng.choice(["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]),
+                "nakshatra": [_nakshatra(rng)],
+                "tithi": [{"id": rng.randrange(30), "name": "Dwitiya", "paksha": rng.choice(["Shukla Paksha", "Krishna Paksha"])}],
+                "karana": [{"id": rng.randrange(11), "name": "Bava"}],
+                "yoga": [{"id": rng.randrange(27), "name": "Siddha"}],
+                "sunrise": params.get("datetime", ""), "sunset": params.get("datetime", "")}
+    if path.endswith("/planet-position"):
+        return {"planet_position": _planets(rng)}
+    if path.endswith("/kundli/advanced"):
+        return {"nakshatra_details": {"nakshatra": _nakshatra(rng),
+                                      "chandra_rasi": {"id": rng.randrange(12), "name": rng.choice(RASIS)},
+                                      "soorya_rasi": {"id": rng.randrange(12), "name": rng.choice(RASIS)}},
+                "mangal_dosha": {"has_dosha": rng.random() < 0.4, "description": "Stub mangal dosha"},
+                "yoga_details": [{"name": "Major Yogas", "description": "Stub yoga"}],
+                "dasha_periods": [{"id": i, "name": p, "start": "2000-01-01T00:00:00+05:30",
+                                   "end": "2010-01-01T00:00:00+05:30"} for i, p in enumerate(PLANETS)]}
+    if path.endswith("/birth-details"):
+        return {"nakshatra": _nakshatra(rng), "chandra_rasi": {"id": rng.randrange(12), "name": rng.choice(RASIS)},
+                "soorya_rasi": {"id": rng.randrange(12), "name": rng.choice(RASIS)}}
+    if path.endswith("/kundli-matching/advanced"):
+        return {"guna_milan": {"total_points": rng.randint(0, 36), "maximum_points": 36},
+                "message": {"type": "good", "description": "Stub match"}}
+    if path.endswith("/porutham/advanced"):
+        return {"total_points": rng.randint(0, 10), "maximum_points": 10,
+                "message": {"type": "good", "description": "Stub porutham"}}
+    if path.endswith("-dosha") or path.endswith("/papasamyam-check"):
+        return {"has_dosha": rng.random() < 0.3, "description": "Stub dosha check"}
+    if path.endswith("/horoscope/daily"):
+        return {"daily_prediction": {"sign_name": params.get("sign", "").title(), "date": params.get("datetime", ""),
+                                     "prediction": "Stub prediction"}}
+    return {"datetime": params.get("datetime", ""), "stub": True}
+
+
+def create_app(config):
+    """Build the stub Starlette app"""
+
+    async def inject(request):
+        config.requests += 1
+        delay = config.latency_ms + (random.uniform(-config.jitter_ms, config.jitter_ms) if config.jitter_ms else 0)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+        headers = {}
+        if config.rate_limit:
+            now = time.monotonic()
+            if now - config.window_start >= 60:
+                config.window_start, config.window_count = now, 0
+            config.window_count += 1
+            remaining = max(0, config.rate_limit - config.window_count)
+            headers = {"X-RateLimit-Limit": str(config.rate_limit), "X-RateLimit-Remaining": str(remaining)}
+            if config.window_count > config.rate_limit:
+                retry_after = int(60 - (now - config.window_start)) + 1
+                return JSONResponse({"status": "error", "errors": [{"title": "Too Many Requests"}]},
+                                    status_code=429, headers={**headers, "Retry-After": str(retry_after)})
+        if config.error_rate and random.random() < config.error_rate:
+            return JSONResponse({"status": "error", "errors": [{"title": "Injected failure"}]},
+                                status_code=503, headers=headers)
+        return headers
+
+    async def token(request):
+        injected = await inject(request)
+        if isinstance(injected, Response):
+            return injected
+        access_token = secrets.token_hex(16)
+        config.tokens.add(access_token)
+        return JSONResponse({"access_token": access_token, "token_type": "Bearer", "expires_in": config.token_ttl})
+
+    async def api(request):
+        auth = request.headers.get("Authorization", "")
+        if not auth.startswith("Bearer ") or auth[7:] not in config.tokens:
+            return JSONResponse({"status": "error", "errors": [{"title": "Unauthorized"}]}, status_code=401)
+        injected = await inject(request)
+        if isinstance(injected, Response):
+            return injected
+
+        path = "/" + request.path_params["path"]
+        params = dict(request.query_params)
+        if path.endswith("/chart") and params.get("format", "svg") == "svg":
+            label = params.get("chart_type", "rasi")
+            svg = f'<svg xmlns="http://www.w3.org/2000/svg" width="400" height="400"><text x="10" y="20">{label}</text></svg>'
+            return Response(svg, media_type="image/svg+xml", headers=injected)
+        return JSONResponse({"status": "ok", "data": _body(path, params)}, headers=injected)
+
+    return Starlette(routes=[
+        Route("/token", token, methods=["POST"]),
+        Route("/v2/{path:path}", api, methods=["GET"]),
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Base response latency")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform +/- latency jitter")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--rate-limit", type=int, default=0, help="Requests per minute before 429s (0 = unlimited)")
+    parser.add_argument("--token-ttl", type=int, default=3600, help="expires_in for issued tokens")
+    args = parser.parse_args()
+
+    config = StubConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.rate_limit, args.token_ttl)
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+from benchmark import percentile
+
+
+def test_percentile_is_nearest_rank():
+    tens = list(range(1, 11))
+    hundred = list(range(1, 101))
+
+    assert percentile(tens, 50) == 5
+    assert percentile(tens, 90) == 9
+    assert percentile(tens, 95) == 10
+    assert percentile(hundred, 99) == 99
+    assert percentile(hundred, 0) == 1
+    assert percentile([], 50) == 0.0
@@ -0,0 +1,77 @@
+import asyncio
+import time
+import zlib
+
+from cache import CachedResponse, ResponseCache, SqliteCache
+
+
+def _disk(tmp_path, **kwargs):
+    return SqliteCache(str(tmp_path / "cache.sqlite"), **kwargs)
+
+
+def test_warm_from_disk_keeps_most_recent_entries_longest(tmp_path):
+    disk = _disk(tmp_path)
+    for key in ("k1", "k2", "k3", "k4"):
+        disk.set(key, CachedResponse(key.encode(), "application/json", None))
+        time.sleep(0.01)
+    cache = ResponseCache(max_entries=3, disk=disk)
+
+    assert cache.warm_from_disk(3) == 3
+    cache._put("k5", CachedResponse(b"k5", "application/json", None))
+
+    assert list(cache._entries) == ["k3", "k4", "k5"]
+
+
+def test_lookup_promotes_disk_hits_to_memory(tmp_path):
+    disk = _disk(tmp_path)
+    disk.set("k", CachedResponse(b"body", "application/json", time.time() + 60))
+    cache = ResponseCache(disk=disk)
+
+    entry = asyncio.run(cache.lookup("k", "/v2/astrology/panchang"))
+
+    assert entry.content == b"body"
+    assert cache.get("k") is not None
+    stats = cache.stats()
+    assert (stats["disk_hits"], stats["hits"], stats["misses"]) == (1, 1, 0)
+
+
+def test_expired_entries_are_kept_for_stale_retention(tmp_path):
+    disk = _disk(tmp_path, stale_retention=3600)
+    cache = ResponseCache(disk=disk, stale_retention=3600)
+    expired = CachedResponse(b"old", "application/json", time.time() - 60)
+    cache._put("k", expired)
+    disk.set("k", expired)
+
+    assert cache.get("k") is None
+    assert "k" in cache._entries
+    assert asyncio.run(cache.peek("k", max_stale=3600)).content == b"old"
+    assert disk.get("k") is None
+    assert disk.get("k", max_stale=3600).content == b"old"
+
+
+def test_expired_entries_beyond_retention_are_dropped(tmp_path):
+    disk = _disk(tmp_path, stale_retention=30)
+    cache = ResponseCache(disk=disk, stale_retention=30)
+    expired = CachedResponse(b"old", "application/json", time.time() - 60)
+    cache._put("k", expired)
+    disk.set("k", expired)
+
+    assert cache.get("k") is None
+    assert "k" not in cache._entries
+    assert disk.get("k") is None
+    assert disk.get("k", max_stale=3600) is None
+
+
+def test_compact_drops_expired_rows_and_evicts_least_recently_used(tmp_path):
+    disk = _disk(tmp_path)
+    disk.set("expired", CachedResponse(b"x" * 100, "application/json", time.time() - 60))
+    disk.set("old", CachedResponse(b"y" * 100, "application/json", None))
+    time.sleep(0.01)
+    disk.set("new", CachedResponse(b"z" * 100, "application/json", None))
+    disk.max_bytes = len(zlib.compress(b"z" * 100, 6))
+
+    disk.compact()
+
+    assert disk.stats()["entries"] == 1
+    assert disk.get("new") is not None
+    assert disk.get("old") is None
@@ -0,0 +1,31 @@
+import json
+import os
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import ephemeris
+from cache import make_cache_key
+from replay import FixtureStore
+
+# Sidereal (Lahiri) positions for fixed charts from Swiss Ephemeris, the library
+# Prokerala is built on, with the mean node, in the shape of planet-position responses
+REFERENCE = os.path.join(os.path.dirname(__file__), "fixtures", "planet_positions.json")
+
+
+def test_local_positions_are_within_tolerances(tmp_path):
+    store = FixtureStore(str(tmp_path / "fixtures.sqlite"))
+    with open(REFERENCE) as f:
+        charts = json.load(f)
+    for chart in charts:
+        key = f"GET {make_cache_key('/v2/astrology/planet-position', chart['params'])}"
+        store.put(key, 200, "application/json", json.dumps(chart["response"]).encode())
+    store.close()
+
+    results = ephemeris.validate(str(tmp_path / "fixtures.sqlite"))
+
+    assert set(results) == set(ephemeris.PLANET_IDS)
+    for name, (worst, _, count) in results.items():
+        assert count == len(charts)
+        assert worst <= ephemeris.TOLERANCES[name], f"{name} is off by {worst:.4f} deg"
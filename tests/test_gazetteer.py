@@ -0,0 +1,25 @@
+import os
+
+import gazetteer
+
+SOURCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gazetteer.tsv")
+
+
+def _places(tmp_path):
+    return gazetteer.Gazetteer(SOURCE, str(tmp_path / "gazetteer.idx"))
+
+
+def test_state_abbreviation_qualifies(tmp_path):
+    places = _places(tmp_path)
+
+    assert [(m["name"], m["state"]) for m in places.search("Cochin, KL")] == [("Kochi", "Kerala")]
+    assert [m["name"] for m in places.search("Kollam kl")] == ["Kollam"]
+    assert [m["name"] for m in places.search("Sydney, NSW")] == ["Sydney"]
+    assert places.search("Kochi, TN") == []
+
+
+def test_full_state_and_country_names_qualify(tmp_path):
+    places = _places(tmp_path)
+
+    assert [m["name"] for m in places.search("Kochi, Kerala")] == ["Kochi"]
+    assert [m["name"] for m in places.search("Kochi, India")] == ["Kochi"]
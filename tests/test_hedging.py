@@ -0,0 +1,53 @@
+import asyncio
+
+import httpx
+
+import coremcp
+from ratelimit import RateLimiter
+
+
+def _fake_upstream(monkeypatch, latency):
+    sends = []
+
+    async def http_send(endpoint, url, headers, params, method, timeout):
+        sends.append(params["sign"])
+        await asyncio.sleep(latency)
+        return httpx.Response(200, json={"status": "ok", "data": {}}, request=httpx.Request("GET", url))
+
+    async def get_auth_headers():
+        return {"Authorization": "Bearer T1"}
+
+    limiter = RateLimiter(rate=0)
+    monkeypatch.setattr(coremcp, "_http_send", http_send)
+    monkeypatch.setattr(coremcp, "get_auth_headers", get_auth_headers)
+    monkeypatch.setattr(coremcp, "rate_limiter", limiter)
+    monkeypatch.setattr(coremcp, "upstream_flights", coremcp.SingleFlight(limiter))
+    monkeypatch.setattr(coremcp, "CACHE_ENABLED", False)
+    monkeypatch.setattr(coremcp, "HEDGE_DELAY", 0.05)
+    return limiter, sends
+
+
+def _horoscopes(signs):
+    async def scenario():
+        return await asyncio.gather(
+            *(coremcp.get_daily_horoscope(sign, "2024-01-01T10:00:00+05:30") for sign in signs)
+        )
+    return asyncio.run(scenario())
+
+
+def test_paused_limiter_does_not_hedge(monkeypatch):
+    limiter, sends = _fake_upstream(monkeypatch, latency=0.01)
+    limiter.pause(0.3)
+
+    results = _horoscopes(["aries", "taurus", "gemini"])
+
+    assert all('"status":"ok"' in result for result in results)
+    assert sorted(sends) == ["aries", "gemini", "taurus"]
+
+
+def test_slow_send_is_hedged_when_a_slot_is_free(monkeypatch):
+    _, sends = _fake_upstream(monkeypatch, latency=0.2)
+
+    _horoscopes(["aries"])
+
+    assert sends == ["aries", "aries"]
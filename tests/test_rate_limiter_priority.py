@@ -0,0 +1,34 @@
+import asyncio
+
+import coremcp
+from ratelimit import BATCH, INTERACTIVE, PREFETCH, RateLimiter
+
+
+def test_interactive_caller_promotes_coalesced_prefetch():
+    async def scenario():
+        limiter = RateLimiter(rate=0)
+        flights = coremcp.SingleFlight(limiter)
+        released = []
+
+        async def send(name, priority):
+            await limiter.acquire(priority)
+            released.append(name)
+            return name
+
+        limiter.pause(0.2)
+        prefetch = asyncio.create_task(flights.do("panchang", lambda p: send("panchang", p), PREFETCH))
+        batch = asyncio.create_task(send("batch", BATCH))
+        await asyncio.sleep(0.01)
+        assert limiter.stats()["queue_depth"] == {"interactive": 0, "batch": 1, "prefetch": 1}
+
+        interactive = asyncio.create_task(flights.do("panchang", lambda p: send("other", p), INTERACTIVE))
+        await asyncio.sleep(0.01)
+        assert limiter.stats()["queue_depth"] == {"interactive": 1, "batch": 1, "prefetch": 0}
+
+        results = await asyncio.gather(prefetch, batch, interactive)
+        return released, results
+
+    released, results = asyncio.run(scenario())
+
+    assert released == ["panchang", "batch"]
+    assert results == ["panchang", "batch", "panchang"]
@@ -0,0 +1,51 @@
+import asyncio
+
+import coremcp
+from tokenstore import TokenStore
+
+
+def _fake_token_endpoint(monkeypatch):
+    requests = []
+
+    async def get_access_token():
+        requests.append(1)
+        token_data = {"access_token": f"T{len(requests)}", "expires_in": 3600}
+        coremcp.save_token_data(token_data)
+        return token_data
+
+    monkeypatch.setattr(coremcp, "get_access_token", get_access_token)
+    return requests
+
+
+def _refresh_after_401(manager):
+    async def scenario():
+        assert (await manager.get_token_data())["access_token"] == "T1"
+        return await manager.refresh(stale_auth="Bearer T1")
+    return asyncio.run(scenario())
+
+
+def test_refresh_after_401_ignores_own_saved_token(tmp_path, monkeypatch):
+    monkeypatch.setattr(coremcp, "token_store", TokenStore(str(tmp_path / "token.json")))
+    requests = _fake_token_endpoint(monkeypatch)
+
+    # T1 is fetched and saved by this process, then rejected
+    token_data = _refresh_after_401(coremcp.TokenManager())
+
+    assert token_data["access_token"] == "T2"
+    assert len(requests) == 2
+
+
+def test_refresh_after_401_ignores_rejected_token_from_other_worker(tmp_path, monkeypatch):
+    path = str(tmp_path / "token.json")
+    monkeypatch.setattr(coremcp, "token_store", TokenStore(path))
+    requests = _fake_token_endpoint(monkeypatch)
+    manager = coremcp.TokenManager()
+    asyncio.run(manager.get_token_data())
+    # Another worker rewrites the file, still holding the token that is about to be rejected
+    other = TokenStore(path)
+    other.write({**other.read(), "rewritten": True})
+
+    token_data = _refresh_after_401(manager)
+
+    assert token_data["access_token"] == "T2"
+    assert len(requests) == 2
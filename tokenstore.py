@@ -0,0 +1,107 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+from contextlib import asynccontextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger("pyyan")
+
+
+class TokenStore:
+    """Token file shared between worker processes
+
+    Writes go to a temp file that is atomically renamed over the token file,
+    so readers never see truncated JSON. Refreshes are serialized across
+    processes with an exclusive lock on a sibling ".lock" file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        self._cached_stat = None
+        self._cached_data = None
+
+    def read(self):
+        """Read token data, skipping the parse if the file hasn't changed"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._cached_stat = None
+            self._cached_data = None
+            return None
+
+        stat_key = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if stat_key != self._cached_stat:
+            with open(self.path, 'r') as f:
+                self._cached_data = json.load(f)
+            self._cached_stat = stat_key
+        return dict(self._cached_data)
+
+    def changed(self):
+        """Check whether another process has rewritten the token file since the last read"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return self._cached_stat is not None
+        return (st.st_mtime_ns, st.st_size, st.st_ino) != self._cached_stat
+
+    def write(self, token_data):
+        """Atomically replace the token file"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".token-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(token_data, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        # Our own write is not a change made by another process
+        st = os.stat(self.path)
+        self._cached_stat = (st.st_mtime_ns, st.st_size, st.st_ino)
+        self._cached_data = dict(token_data)
+
+    @asynccontextmanager
+    async def locked(self):
+        """Hold the cross-process refresh lock without blocking the event loop"""
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            await asyncio.to_thread(_lock_fd, fd)
+            try:
+                yield
+            finally:
+                _unlock_fd(fd)
+        finally:
+            os.close(fd)
+
+
+def _lock_fd(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                # LK_LOCK gives up after ~10 seconds; keep waiting
+                continue
+
+
+def _unlock_fd(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
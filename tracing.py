@@ -0,0 +1,61 @@
+import json
+import logging
+import random
+
+trace_logger = logging.getLogger("pyyan.trace")
+
+# Trace levels, each including everything from the previous one
+OFF = 0
+SUMMARY = 1   # method, endpoint, status, elapsed time, size
+HEADERS = 2   # + params and headers (credentials redacted)
+BODY = 3      # + response body, truncated
+
+LEVELS = {"off": OFF, "summary": SUMMARY, "headers": HEADERS, "body": BODY}
+
+REDACTED_HEADERS = {"authorization", "cookie", "set-cookie"}
+REDACTED_PARAMS = {"client_secret", "access_token"}
+
+
+class Tracer:
+    """Sampled, structured tracing of upstream calls
+
+    Call sites check `tracer.sampled()` before building anything, so a
+    disabled tracer costs one attribute check per request.
+    """
+
+    def __init__(self, level="off", sample_rate=1.0, max_body=2048):
+        self.level = LEVELS.get(str(level).lower(), OFF)
+        self.sample_rate = sample_rate
+        self.max_body = max_body
+
+    def sampled(self):
+        """Decide whether to trace this request"""
+        if self.level == OFF:
+            return False
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def upstream(self, method, url, params, headers, response=None, elapsed=None, error=None, include_body=True):
+        """Emit one JSON line describing an upstream request and its outcome"""
+        event = {"event": "upstream", "method": method.upper(), "url": str(url).split("?")[0]}
+        if elapsed is not None:
+            event["elapsed_ms"] = round(elapsed * 1000, 1)
+        if response is not None:
+            event["status"] = response.status_code
+            event["bytes"] = len(response.content)
+        if error is not None:
+            event["error"] = f"{type(error).__name__}: {error}"
+        if self.level >= HEADERS:
+            event["params"] = _redact(params or {}, REDACTED_PARAMS)
+            event["request_headers"] = _redact(headers or {}, REDACTED_HEADERS)
+            if response is not None:
+                event["response_headers"] = _redact(response.headers, REDACTED_HEADERS)
+        if self.level >= BODY and include_body and response is not None:
+            body = response.text
+            if len(body) > self.max_body:
+                body = body[:self.max_body] + f"...[{len(body) - self.max_body} more chars]"
+            event["body"] = body
+        trace_logger.info(json.dumps(event, ensure_ascii=False, default=str))
+
+
+def _redact(mapping, secret_keys):
+    return {k: ("***" if str(k).lower() in secret_keys else v) for k, v in mapping.items()}